@@ -0,0 +1,128 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Iterable, Optional
+from expensy_client import ExpensyClient
+
+
+class AsyncExpensyClient:
+    """asyncio version of ExpensyClient
+
+    The requests run on the pooled session of a regular ExpensyClient in a
+    worker pool, so the category cache and validation are shared with it.
+    A semaphore limits how many requests are in flight at once. It is meant
+    for asyncio programs such as import scripts, the app sends its records
+    through RecordSubmitter instead.
+    """
+
+    def __init__(
+        self,
+        base_url: str = "http://192.168.0.243:8000",
+        client: Optional[ExpensyClient] = None,
+        max_concurrency: int = 8,
+    ):
+        """
+        Initialize the async client
+        Args:
+            base_url: Base URL of the REST service, ignored if client is given
+            client: ExpensyClient used to send the requests, its pool_size
+            should be at least max_concurrency so connections are kept alive
+            max_concurrency: Maximum number of requests in flight
+        """
+        # One pooled connection per request in flight, a smaller pool closes
+        # the extra connections instead of keeping them alive
+        self.client = client or ExpensyClient(base_url, pool_size=max_concurrency)
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="expensy-async"
+        )
+        self._semaphore = None
+
+    async def _call(self, func, *args, **kwargs):
+        # The semaphore is created lazily so it belongs to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_running_loop()
+        async with self._semaphore:
+            return await loop.run_in_executor(
+                self._executor, lambda: func(*args, **kwargs)
+            )
+
+    def get_cached_categories(self) -> Optional[List[Dict[str, any]]]:
+        """Return the last known categories without any network request"""
+        return self.client.get_cached_categories()
+
+    async def get_categories(self, force_refresh: bool = False) -> List[Dict[str, any]]:
+        """Get available categories, see ExpensyClient.get_categories"""
+        return await self._call(self.client.get_categories, force_refresh)
+
+    async def create_record(
+        self,
+        record_data: Dict[str, any],
+        idempotency_key: Optional[str] = None,
+        allow_duplicate: bool = False,
+    ) -> Dict[str, any]:
+        """Create a new expense/income record, see ExpensyClient.create_record"""
+        # Validate before taking a slot so bad records fail right away
+        self.client.validate_record(record_data)
+        return await self._call(
+            self.client.create_record,
+            record_data,
+            idempotency_key=idempotency_key,
+            allow_duplicate=allow_duplicate,
+        )
+
+    async def create_records(
+        self, records: Iterable[Dict[str, any]], batch_size: int = 50
+    ) -> List[Dict[str, any]]:
+        """
+        Create many records concurrently
+        Up to max_concurrency records are in flight at any time, and only one
+        batch of them is read from the input at a time.
+        Returns:
+            One result per record in input order, with the same structure as
+            in ExpensyClient.create_records
+        """
+
+        async def create(index, record_data):
+            try:
+                result = await self.create_record(record_data)
+            except Exception as e:
+                return ExpensyClient._batch_result(index, record_data, error=e)
+            return ExpensyClient._batch_result(index, record_data, result)
+
+        results = []
+        batch = []
+        for index, record_data in enumerate(records):
+            batch.append(create(index, record_data))
+            if len(batch) >= batch_size:
+                results.extend(await asyncio.gather(*batch))
+                batch = []
+        if batch:
+            results.extend(await asyncio.gather(*batch))
+        return results
+
+    def close(self):
+        """Close the client session and the worker pool"""
+        self._executor.shutdown(wait=False)
+        self.client.close()
+
+    async def aclose(self):
+        """Close the client without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, self.close)
+
+    def __enter__(self):
+        """Context manager entry"""
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        """Context manager exit"""
+        self.close()
+
+    async def __aenter__(self):
+        """Async context manager entry"""
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        """Async context manager exit"""
+        await self.aclose()
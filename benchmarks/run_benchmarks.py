@@ -0,0 +1,315 @@
+"""Headless benchmarks for ExpensyClient and the ExpenseForm hot paths
+
+Usage:
+    python benchmarks/run_benchmarks.py [--output results.json] [--records 200]
+        [--latency 0.005] [--error-rate 0.0] [--skip-widgets]
+
+Results are written as JSON to --output (or printed when it is not given), so
+runs on different commits can be compared.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from stub_server import StubExpensyServer  # noqa: E402
+
+
+def summarize(latencies, elapsed):
+    """Latency distribution in milliseconds and throughput per second"""
+    ordered = sorted(latencies)
+
+    def percentile(percent):
+        if not ordered:
+            return 0.0
+        index = min(len(ordered) - 1, int(len(ordered) * percent / 100))
+        return ordered[index] * 1000
+
+    return {
+        "count": len(ordered),
+        "total_s": elapsed,
+        "per_second": len(ordered) / elapsed if elapsed else 0.0,
+        "mean_ms": statistics.fmean(ordered) * 1000 if ordered else 0.0,
+        "p50_ms": percentile(50),
+        "p95_ms": percentile(95),
+        "p99_ms": percentile(99),
+        "max_ms": ordered[-1] * 1000 if ordered else 0.0,
+    }
+
+
+def timed(func, repeat):
+    """Run func repeat times and return the duration of each run"""
+    durations = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        durations.append(time.perf_counter() - started)
+    return durations
+
+
+def span_durations(name):
+    """Client hook that keeps the duration of every span with the given name
+    Returns:
+        (list the durations are appended to, hook for ExpensyClient)
+    """
+    durations = []
+
+    def hook(span):
+        if span["name"] == name:
+            durations.append(span["duration"])
+
+    return durations, hook
+
+
+def make_records(count):
+    return [
+        {
+            "description": f"Benchmark {i}",
+            "amount": 10.5 + i,
+            "source": "benchmark",
+            "date": "2024-12-01",
+            "category": 1,
+        }
+        for i in range(count)
+    ]
+
+
+def new_client(base_url, **kwargs):
+    from category_cache import CategoryCache
+    from expensy_client import ExpensyClient
+
+    cache_path = os.path.join(tempfile.mkdtemp(), "categories.json")
+    return ExpensyClient(base_url, category_cache=CategoryCache(cache_path), **kwargs)
+
+
+def bench_create_record(args):
+    results = {}
+    records = make_records(args.records)
+    with StubExpensyServer(latency=args.latency, error_rate=args.error_rate) as server:
+        # Serial without keep-alive: one connection per record
+        with new_client(server.base_url) as client:
+            client.session.headers["Connection"] = "close"
+            results["serial_no_keepalive"] = run_serial(client, records, server)
+        # Serial over the pooled keep-alive session
+        with new_client(server.base_url) as client:
+            results["serial_pooled"] = run_serial(client, records, server)
+        # Concurrent single POSTs through create_records
+        durations, hook = span_durations("create_record")
+        with new_client(server.base_url, hooks=[hook]) as client:
+            started = time.perf_counter()
+            connections = server.connections
+            items = list(
+                client.create_records(
+                    records, batch_size=args.batch_size, max_workers=args.workers
+                )
+            )
+            elapsed = time.perf_counter() - started
+            results["concurrent"] = summarize(durations, elapsed)
+            results["concurrent"]["errors"] = sum(1 for i in items if i["error"])
+            results["concurrent"]["connections"] = server.connections - connections
+    with StubExpensyServer(latency=args.latency, bulk=True) as server:
+        # One latency per bulk request, per_second counts requests too
+        durations, hook = span_durations("create_records")
+        with new_client(server.base_url, hooks=[hook]) as client:
+            started = time.perf_counter()
+            items = list(client.create_records(records, batch_size=args.batch_size))
+            elapsed = time.perf_counter() - started
+            results["bulk"] = summarize(durations, elapsed)
+            results["bulk"]["records"] = len(items)
+            results["bulk"]["records_per_second"] = len(items) / elapsed
+            results["bulk"]["requests"] = server.requests
+    return results
+
+
+def run_serial(client, records, server):
+    latencies = []
+    errors = 0
+    connections = server.connections
+    started = time.perf_counter()
+    for record in records:
+        request_started = time.perf_counter()
+        try:
+            client.create_record(record)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - request_started)
+    result = summarize(latencies, time.perf_counter() - started)
+    result["errors"] = errors
+    result["connections"] = server.connections - connections
+    return result
+
+
+def bench_categories(args):
+    results = {}
+    with StubExpensyServer(categories=args.categories) as server:
+        with new_client(server.base_url) as client:
+            durations = timed(lambda: client.get_categories(force_refresh=True), 1)
+            results["download"] = summarize(durations, sum(durations))
+            # Later requests are revalidated with the stored ETag
+            durations = timed(
+                lambda: client.get_categories(force_refresh=True), args.repeat
+            )
+            results["revalidate_304"] = summarize(durations, sum(durations))
+            durations = timed(client.get_categories, args.repeat)
+            results["cache_hit"] = summarize(durations, sum(durations))
+    results["categories"] = args.categories
+    return results
+
+
+def bench_widgets(args):
+    os.environ.setdefault("KIVY_NO_ARGS", "1")
+    os.environ.setdefault("KIVY_NO_CONSOLELOG", "1")
+    os.environ.setdefault("KIVY_GL_BACKEND", "mock")
+    try:
+        import main
+    except Exception as e:
+        return {"skipped": f"Kivy not available: {e}"}
+    from outbox import RecordOutbox
+    from record_submitter import RecordSubmitter
+
+    results = {}
+    with StubExpensyServer() as server, new_client(server.base_url) as client:
+        submitter = RecordSubmitter(client, outbox=RecordOutbox(":memory:"))
+
+        def build_form():
+            form = main.ExpenseForm(client=client, submitter=submitter)
+            form.build_deferred_sections()
+            return form
+
+        durations = timed(build_form, args.repeat)
+        results["expense_form_init"] = summarize(durations, sum(durations))
+
+        picker = main.DatePickerWidget()
+        durations = timed(lambda: picker.open_date_picker(None), 1)
+        results["open_date_picker_first"] = summarize(durations, sum(durations))
+        durations = timed(lambda: picker.open_date_picker(None), args.repeat)
+        results["open_date_picker_reuse"] = summarize(durations, sum(durations))
+        durations = timed(picker.update_calendar_grid, args.repeat)
+        results["update_calendar_grid"] = summarize(durations, sum(durations))
+        durations = timed(lambda: picker.change_month(1), args.repeat)
+        results["change_month"] = summarize(durations, sum(durations))
+        submitter.shutdown()
+    return results
+
+
+def bench_json(args):
+    import json_codec
+
+    # A multi-megabyte page of records, like a full ledger sync
+    payload = {"next": None, "results": make_records(args.json_records)}
+    data = json_codec.dumps(payload)
+    results = {"backend": json_codec.BACKEND, "bytes": len(data)}
+    codecs = {
+        "stdlib": (lambda: json.dumps(payload).encode("utf-8"), json.loads),
+        json_codec.BACKEND: (lambda: json_codec.dumps(payload), json_codec.loads),
+    }
+    for name, (encode, decode) in codecs.items():
+        durations = timed(encode, args.repeat)
+        results[f"{name}_dumps"] = summarize(durations, sum(durations))
+        durations = timed(lambda: decode(data), args.repeat)
+        results[f"{name}_loads"] = summarize(durations, sum(durations))
+    return results
+
+
+def bench_analytics(args):
+    from ledger import RecordLedger
+    from spending_analytics import ANALYTICS_AVAILABLE, SpendingAnalytics
+
+    if not ANALYTICS_AVAILABLE:
+        return {"skipped": "numpy not available"}
+
+    def add_records(ledger, first, count):
+        ledger.upsert(
+            (
+                {
+                    "id": i + 1,
+                    "description": f"Registro {i}",
+                    "amount": 10.5 + i % 500,
+                    "date": f"{2020 + i % 5}-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                    "category": i % 20,
+                    "modified": f"{i:012d}",
+                }
+                for i in range(first, first + count)
+            ),
+            f"{first + count - 1:012d}",
+        )
+
+    results = {}
+    ledger = RecordLedger(os.path.join(tempfile.mkdtemp(), "ledger.sqlite3"))
+    for first in range(0, args.analytics_records, 50000):
+        add_records(ledger, first, min(50000, args.analytics_records - first))
+    # Every full load reads the whole ledger, a few runs are enough
+    durations = timed(lambda: SpendingAnalytics.from_ledger(ledger), 3)
+    results["from_ledger"] = summarize(durations, sum(durations))
+    analytics = SpendingAnalytics.from_ledger(ledger)
+    durations = timed(lambda: analytics.refresh(ledger), args.repeat)
+    results["refresh_unchanged"] = summarize(durations, sum(durations))
+    # The records of a sync, appended to the cached arrays
+    durations = []
+    for n in range(args.repeat):
+        add_records(ledger, args.analytics_records + n * 100, 100)
+        durations += timed(lambda: analytics.refresh(ledger), 1)
+    results["refresh_100_new"] = summarize(durations, sum(durations))
+    durations = timed(lambda: analytics.summary(today="2024-12-31"), args.repeat)
+    results["summary"] = summarize(durations, sum(durations))
+    results["records"] = len(analytics)
+    ledger.close()
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--output", help="JSON file for the results")
+    parser.add_argument("--records", type=int, default=200)
+    parser.add_argument("--categories", type=int, default=50000)
+    parser.add_argument("--json-records", type=int, default=50000)
+    parser.add_argument("--analytics-records", type=int, default=1000000)
+    parser.add_argument("--latency", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--skip-widgets", action="store_true")
+    args = parser.parse_args()
+
+    results = {
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "create_record": bench_create_record(args),
+        "categories": bench_categories(args),
+        "json": bench_json(args),
+        "analytics": bench_analytics(args),
+    }
+    if not args.skip_widgets:
+        results["widgets"] = bench_widgets(args)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Results written to {args.output}")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class StubExpensyServer:
+    """Local stand-in for the Expensy API with configurable latency and errors
+
+    Serves /api/categories/ (with ETag), paginated /api/records/, POST
+    /api/records/ and, if enabled, POST /api/records/bulk/.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        error_rate: float = 0.0,
+        categories: int = 20,
+        records: int = 0,
+        bulk: bool = False,
+        seed: int = 0,
+    ):
+        """
+        Initialize the server, it listens on a free local port
+        Args:
+            latency: Seconds added to every response
+            error_rate: Fraction of record POSTs answered with a 500
+            categories: Number of categories returned
+            records: Number of records already stored on the server
+            bulk: Whether the bulk endpoint exists
+            seed: Seed for the error generator, so runs are comparable
+        """
+        self.latency = latency
+        self.error_rate = error_rate
+        self.bulk = bulk
+        self.random = random.Random(seed)
+        self.categories = [
+            {"id": i, "name": f"Categoría {i}", "alt_name": f"Category {i}"}
+            for i in range(1, categories + 1)
+        ]
+        self.records = [
+            {
+                "id": i,
+                "description": f"Registro {i}",
+                "amount": float(i % 500 + 1),
+                "source": "benchmark",
+                "date": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                "category": i % categories + 1 if categories else None,
+                "modified": f"2024-01-01T00:00:{i:06d}",
+            }
+            for i in range(1, records + 1)
+        ]
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections = 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "StubExpensyServer":
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Buffer the response so headers and body go out in one segment,
+            # otherwise Nagle and delayed ACKs add ~40 ms per keep-alive request
+            wbufsize = 64 * 1024
+
+            def setup(self):
+                super().setup()
+                with stub.lock:
+                    stub.connections += 1
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_HEAD(self):
+                self._count()
+                self._send(200, b"")
+
+            def do_GET(self):
+                self._count()
+                url = urlparse(self.path)
+                if url.path == "/api/categories/":
+                    etag = f'"{len(stub.categories)}"'
+                    if self.headers.get("If-None-Match") == etag:
+                        self._send(304, b"", {"ETag": etag})
+                        return
+                    body = {"next": None, "results": stub.categories}
+                    self._send_json(200, body, {"ETag": etag})
+                elif url.path == "/api/records/":
+                    self._send_json(200, self._records_page(url))
+                else:
+                    self._send_json(404, {"detail": "Not found"})
+
+            def do_POST(self):
+                self._count()
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"null")
+                path = urlparse(self.path).path
+                if path == "/api/records/bulk/" and stub.bulk:
+                    self._send_json(201, [self._create(item) for item in payload])
+                elif path == "/api/records/":
+                    with stub.lock:
+                        failed = stub.random.random() < stub.error_rate
+                    if failed:
+                        self._send_json(500, {"detail": "Simulated error"})
+                    else:
+                        self._send_json(201, self._create(payload))
+                else:
+                    self._send_json(404, {"detail": "Not found"})
+
+            def _records_page(self, url):
+                query = parse_qs(url.query)
+                page_size = int(query.get("page_size", ["100"])[0])
+                offset = int(query.get("offset", ["0"])[0])
+                since = query.get("modified_since", [""])[0]
+                records = [r for r in stub.records if r["modified"] > since]
+                page = records[offset : offset + page_size]
+                next_url = None
+                if offset + page_size < len(records):
+                    next_url = (
+                        f"{stub.base_url}/api/records/?page_size={page_size}"
+                        f"&offset={offset + page_size}&modified_since={since}"
+                    )
+                return {"next": next_url, "results": page}
+
+            def _create(self, record):
+                with stub.lock:
+                    record_id = len(stub.records) + 1
+                    created = dict(record, id=record_id)
+                    stub.records.append(dict(created, modified=f"{time.time():f}"))
+                return created
+
+            def _count(self):
+                with stub.lock:
+                    stub.requests += 1
+                if stub.latency:
+                    time.sleep(stub.latency)
+
+            def _send_json(self, status, body, headers=None):
+                self._send(status, json.dumps(body).encode("utf-8"), headers)
+
+            def _send(self, status, data, headers=None):
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if self.headers.get("Connection", "").lower() == "close":
+                    self.send_header("Connection", "close")
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(data)
+
+        return Handler
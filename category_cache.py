@@ -0,0 +1,115 @@
+import os
+import threading
+import time
+from typing import List, Dict, Optional
+import json_codec
+
+# Default location of the on-disk cache
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".expensy")
+
+
+class CategoryCache:
+    """Persistent on-disk cache for the categories returned by the service"""
+
+    def __init__(self, path: Optional[str] = None, ttl: float = 24 * 60 * 60):
+        """
+        Initialize the category cache
+        Args:
+            path: JSON file where the categories are stored
+            ttl: Seconds a cached list is considered fresh without revalidation
+        """
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "categories.json")
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entry = None
+        # Counters to check how many round-trips the cache saves
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.stale_hits = 0
+
+    def load(self) -> Optional[Dict[str, any]]:
+        """
+        Return the cached entry, reading it from disk the first time
+        Returns:
+            Dictionary with the keys "categories", "etag", "last_modified" and
+            "fetched_at", or None if nothing has been cached yet
+        """
+        with self._lock:
+            if self._entry is None:
+                try:
+                    with open(self.path, "rb") as f:
+                        entry = json_codec.loads(f.read())
+                    if isinstance(entry.get("categories"), list):
+                        self._entry = entry
+                except (OSError, ValueError, AttributeError, json_codec.DecodeError):
+                    return None
+            return self._entry
+
+    def get_categories(self) -> Optional[List[Dict[str, any]]]:
+        """Return the last known categories without touching the network"""
+        entry = self.load()
+        return entry["categories"] if entry else None
+
+    def is_fresh(self) -> bool:
+        """Check whether the cached entry is still inside its TTL"""
+        entry = self.load()
+        if not entry:
+            return False
+        return time.time() - entry.get("fetched_at", 0) < self.ttl
+
+    def validators(self) -> Dict[str, str]:
+        """Conditional request headers for revalidating the cached entry"""
+        entry = self.load()
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def store(
+        self,
+        categories: List[Dict[str, any]],
+        etag: Optional[str] = None,
+        last_modified: Optional[str] = None,
+    ):
+        """Save a freshly downloaded category list"""
+        self._save(
+            {
+                "categories": categories,
+                "etag": etag,
+                "last_modified": last_modified,
+                "fetched_at": time.time(),
+            }
+        )
+
+    def touch(self):
+        """Mark the cached entry as fresh after a 304 Not Modified"""
+        entry = self.load()
+        if entry:
+            self._save(dict(entry, fetched_at=time.time()))
+
+    def stats(self) -> Dict[str, int]:
+        """Return the hit/miss/revalidation counters"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "revalidations": self.revalidations,
+            "stale_hits": self.stale_hits,
+        }
+
+    def _save(self, entry: Dict[str, any]):
+        with self._lock:
+            self._entry = entry
+            try:
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+                tmp_path = f"{self.path}.tmp"
+                # Encoded in one call, json.dump would stream it chunk by chunk
+                with open(tmp_path, "wb") as f:
+                    f.write(json_codec.dumps(entry))
+                # Atomic replace so a crash never leaves a half-written cache
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"Error writing category cache: {e}")
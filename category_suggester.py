@@ -0,0 +1,122 @@
+import math
+import threading
+from typing import Dict, Iterable, List, Optional
+from duplicate_index import normalize_description
+
+
+def tokenize(text: str) -> List[str]:
+    """Words of a description, without numbers or single letters"""
+    return [
+        token
+        for token in normalize_description(text).split()
+        if len(token) > 1 and not token.isdigit()
+    ]
+
+
+class CategorySuggester:
+    """Naive Bayes classifier from description words to category ids
+
+    It only keeps counters: records per category and occurrences of each word
+    per category. Learning a record updates them in O(words), and a
+    suggestion scores only the categories that share a word with the
+    description, so it takes microseconds while the user types.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # word -> {category: occurrences}
+        self._word_counts = {}
+        # category -> records, category -> words in all its records
+        self._category_records = {}
+        self._category_words = {}
+        self._records = 0
+        # Server ids already learned, so a record seen in a save and again in
+        # a sync is only counted once
+        self._learned_ids = set()
+
+    def __len__(self) -> int:
+        return self._records
+
+    def learn(
+        self, description: str, category: int, record_id: Optional[int] = None
+    ) -> bool:
+        """
+        Add a record to the counters
+        Args:
+            description: Description of the record
+            category: Its category id
+            record_id: Server id, the record is skipped if it was seen before
+        Returns:
+            Whether the record was learned
+        """
+        words = tokenize(description)
+        if not words or category is None:
+            return False
+        with self._lock:
+            if record_id is not None:
+                if record_id in self._learned_ids:
+                    return False
+                self._learned_ids.add(record_id)
+            self._records += 1
+            self._category_records[category] = (
+                self._category_records.get(category, 0) + 1
+            )
+            self._category_words[category] = (
+                self._category_words.get(category, 0) + len(words)
+            )
+            for word in words:
+                counts = self._word_counts.setdefault(word, {})
+                counts[category] = counts.get(category, 0) + 1
+        return True
+
+    def learn_many(self, records: Iterable[Dict[str, any]]) -> int:
+        """
+        Learn records with the create_record structure, e.g. from the ledger
+        Returns:
+            Number of records learned
+        """
+        return sum(
+            self.learn(
+                record.get("description", ""), record.get("category"), record.get("id")
+            )
+            for record in records
+        )
+
+    def suggest(self, description: str) -> Optional[int]:
+        """Most likely category id, or None if no word was seen before"""
+        return self._best(tokenize(description))
+
+    def suggest_many(self, descriptions: Iterable[str]) -> List[Optional[int]]:
+        """
+        Suggest the categories of many descriptions, e.g. an imported file
+        Repeated descriptions are only scored once.
+        """
+        cache = {}
+        suggestions = []
+        for description in descriptions:
+            words = tuple(tokenize(description))
+            if words not in cache:
+                cache[words] = self._best(words)
+            suggestions.append(cache[words])
+        return suggestions
+
+    def _best(self, words) -> Optional[int]:
+        with self._lock:
+            known = [self._word_counts[w] for w in words if w in self._word_counts]
+            if not known:
+                return None
+            candidates = set()
+            for counts in known:
+                candidates.update(counts)
+            vocabulary = len(self._word_counts)
+            best, best_score = None, -math.inf
+            for category in candidates:
+                # log P(category) + sum of log P(word | category), with
+                # Laplace smoothing so unseen pairs do not rule a category out
+                denominator = self._category_words[category] + vocabulary
+                score = math.log(self._category_records[category] / self._records)
+                for counts in known:
+                    score += math.log((counts.get(category, 0) + 1) / denominator)
+                if score > best_score:
+                    best, best_score = category, score
+            return best
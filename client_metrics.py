@@ -0,0 +1,110 @@
+import json
+import threading
+from bisect import bisect_left
+from typing import Dict
+
+# Upper bounds in milliseconds of the latency histogram buckets
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+
+class RequestMetrics:
+    """Per-endpoint counters and latency histograms for ExpensyClient
+
+    ExpensyClient reports every operation as a span, a dictionary with keys:
+        name: Operation, e.g. "create_record"
+        endpoint: API endpoint, e.g. "records"
+        start: Wall clock time when the operation started
+        duration: Seconds for the whole operation
+        connect: Seconds opening connections (DNS lookup, TCP and TLS)
+        wait: Seconds from the request until the response headers arrived,
+        without the connect time
+        transfer: Seconds reading the response bodies
+        decode: Seconds decoding JSON
+        requests: HTTP requests sent
+        retries: Requests repeated after an error
+        new_connections: Requests that had to open a connection
+        bytes_sent / bytes_received: Body sizes
+        status: Last HTTP status code, None if no response arrived
+        error: Error message, None if the operation succeeded
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def record(self, span: Dict[str, any]):
+        """Add a finished span to the counters"""
+        with self._lock:
+            stats = self._endpoints.get(span["endpoint"])
+            if stats is None:
+                stats = self._endpoints[span["endpoint"]] = {
+                    "calls": 0,
+                    "errors": 0,
+                    "requests": 0,
+                    "retries": 0,
+                    "new_connections": 0,
+                    "bytes_sent": 0,
+                    "bytes_received": 0,
+                    "connect": 0.0,
+                    "wait": 0.0,
+                    "transfer": 0.0,
+                    "decode": 0.0,
+                    "latency_ms": [0] * (len(LATENCY_BUCKETS) + 1),
+                }
+            stats["calls"] += 1
+            if span["error"]:
+                stats["errors"] += 1
+            for key in (
+                "requests",
+                "retries",
+                "new_connections",
+                "bytes_sent",
+                "bytes_received",
+                "connect",
+                "wait",
+                "transfer",
+                "decode",
+            ):
+                stats[key] += span[key]
+            bucket = bisect_left(LATENCY_BUCKETS, span["duration"] * 1000)
+            stats["latency_ms"][bucket] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, any]]:
+        """
+        Copy of the counters per endpoint
+        Each endpoint includes "connection_reuse", the fraction of requests
+        served over an already open connection, and "latency_ms", the number
+        of calls per bucket of LATENCY_BUCKETS (the last one is unbounded).
+        """
+        with self._lock:
+            snapshot = {}
+            for endpoint, stats in self._endpoints.items():
+                stats = dict(stats, latency_ms=list(stats["latency_ms"]))
+                requests = stats["requests"]
+                stats["connection_reuse"] = (
+                    1 - stats["new_connections"] / requests if requests else None
+                )
+                snapshot[endpoint] = stats
+            return snapshot
+
+    def reset(self):
+        with self._lock:
+            self._endpoints.clear()
+
+
+class JsonLinesSpanExporter:
+    """Span hook that appends every span as a JSON line to a local file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, span: Dict[str, any]):
+        line = json.dumps(span, default=str)
+        with self._lock:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            except OSError as e:
+                print(f"Error exporting span: {e}")
+
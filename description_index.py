@@ -0,0 +1,183 @@
+import threading
+from bisect import bisect_left, insort
+from datetime import date
+from heapq import nlargest
+from typing import Dict, Iterable, List, Optional
+from duplicate_index import normalize_description
+
+# Reference date for the recency weights
+EPOCH = date(2000, 1, 1)
+
+# Past this many matches a prefix keeps its ranking cached
+CACHE_THRESHOLD = 64
+
+
+class DescriptionIndex:
+    """Autocomplete for descriptions, ranked by frequency and recency
+
+    The normalized descriptions are kept in a sorted list, so the ones that
+    start with a prefix are a contiguous slice found with bisect. Every use
+    adds 2 ** (days since EPOCH / half_life_days) to the description score
+    (forward decay), so recent uses weigh more and the order never has to be
+    recomputed as time passes. Prefixes that match many descriptions keep
+    their top entries cached and updated on every add, so lookups stay under
+    a millisecond with 100k distinct descriptions.
+    """
+
+    def __init__(self, limit: int = 5, half_life_days: float = 90.0):
+        """
+        Initialize an empty index
+        Args:
+            limit: Maximum number of suggestions returned
+            half_life_days: Days after which a use counts half as much
+        """
+        self.limit = limit
+        self.half_life_days = half_life_days
+        self._lock = threading.Lock()
+        self._keys = []
+        # normalized key -> [text shown, score]
+        self._entries = {}
+        # prefix -> keys of its best entries, best first
+        self._top = {}
+        # Server ids already added, so a record seen in a save and again in a
+        # sync is only counted once
+        self._added_ids = set()
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def add(
+        self,
+        description: str,
+        day: Optional[str] = None,
+        record_id: Optional[int] = None,
+    ) -> bool:
+        """
+        Record a use of a description
+        Args:
+            description: Description as the user typed it
+            day: Date of the record in YYYY-MM-DD format, today if not given
+            record_id: Server id, the record is skipped if it was seen before
+        Returns:
+            Whether the use was added
+        """
+        key = normalize_description(description)
+        if not key:
+            return False
+        with self._lock:
+            if record_id is not None:
+                if record_id in self._added_ids:
+                    return False
+                self._added_ids.add(record_id)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = [description.strip(), 0.0]
+                insort(self._keys, key)
+            entry[0] = description.strip()
+            entry[1] += self._weight(day)
+            for end in range(1, len(key) + 1):
+                top = self._top.get(key[:end])
+                if top is None:
+                    continue
+                if key not in top:
+                    top.append(key)
+                top.sort(key=lambda k: self._entries[k][1], reverse=True)
+                del top[self.limit :]
+        return True
+
+    def add_many(self, records: Iterable[Dict[str, any]]) -> int:
+        """
+        Record the descriptions of many records, e.g. the ledger
+        The sorted list is rebuilt once instead of inserting one at a time.
+        Records with an "id" that was added before are skipped.
+        Returns:
+            Number of records added
+        """
+        # Read the records without the lock, suggestions keep working meanwhile
+        updates = {}
+        count = 0
+        # record id -> (key, description, weight), checked under the lock in
+        # case a save adds one of them meanwhile
+        by_id = {}
+        for record in records:
+            description = str(record.get("description") or "").strip()
+            key = normalize_description(description)
+            if not key:
+                continue
+            weight = self._weight(record.get("date"))
+            record_id = record.get("id")
+            if record_id is None:
+                update = updates.setdefault(key, [description, 0.0])
+                update[1] += weight
+                count += 1
+            elif record_id not in self._added_ids:
+                by_id[record_id] = (key, description, weight)
+        with self._lock:
+            for record_id, (key, description, weight) in by_id.items():
+                if record_id in self._added_ids:
+                    continue
+                self._added_ids.add(record_id)
+                update = updates.setdefault(key, [description, 0.0])
+                update[1] += weight
+                count += 1
+            for key, (description, weight) in updates.items():
+                entry = self._entries.setdefault(key, [description, 0.0])
+                entry[1] += weight
+            self._keys = sorted(self._entries)
+            self._top.clear()
+        return count
+
+    def warm(self):
+        """
+        Rank ahead of time every prefix with more than CACHE_THRESHOLD matches
+        Only those prefixes are slow to rank, the rest are small slices.
+        """
+        with self._lock:
+            keys = self._keys
+        prefixes = sorted({key[:1] for key in keys})
+        while prefixes:
+            children = set()
+            for prefix in prefixes:
+                start = bisect_left(keys, prefix)
+                end = bisect_left(keys, prefix + "\uffff", start)
+                if end - start <= CACHE_THRESHOLD:
+                    continue
+                self.suggest(prefix)
+                size = len(prefix) + 1
+                children.update(
+                    key[:size] for key in keys[start:end] if len(key) >= size
+                )
+            prefixes = sorted(children)
+
+    def suggest(self, text: str, limit: Optional[int] = None) -> List[str]:
+        """
+        Descriptions starting with the given text, best first
+        Args:
+            text: What the user has typed so far
+            limit: Maximum number of suggestions, at most the index limit
+        """
+        prefix = normalize_description(text)
+        if not prefix:
+            return []
+        limit = min(limit or self.limit, self.limit)
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is None:
+                start = bisect_left(self._keys, prefix)
+                # Every key with the prefix sorts before prefix + U+FFFF
+                end = bisect_left(self._keys, prefix + "\uffff", start)
+                top = nlargest(
+                    self.limit,
+                    self._keys[start:end],
+                    key=lambda k: self._entries[k][1],
+                )
+                if end - start > CACHE_THRESHOLD:
+                    self._top[prefix] = top
+            return [self._entries[key][0] for key in top[:limit]]
+
+    def _weight(self, day: Optional[str]) -> float:
+        try:
+            days = (date.fromisoformat(str(day)) - EPOCH).days
+        except ValueError:
+            days = (date.today() - EPOCH).days
+        return 2.0 ** (days / self.half_life_days)
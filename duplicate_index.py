@@ -0,0 +1,256 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from datetime import date, timedelta
+from typing import Dict, Iterable, Optional
+from category_cache import DEFAULT_CACHE_DIR
+
+# Records inserted per transaction when loading in bulk
+LOAD_BATCH_SIZE = 5000
+
+
+class DuplicateRecordError(ValueError):
+    """The record matches one that was already created"""
+
+    def __init__(self, record_data: Dict[str, any], matched_date: str):
+        super().__init__(
+            f"Duplicate record: '{record_data.get('description')}' "
+            f"already created on {matched_date}"
+        )
+        self.record_data = record_data
+        self.matched_date = matched_date
+
+
+def normalize_description(text: str) -> str:
+    """Lower case without accents, punctuation or repeated spaces"""
+    text = unicodedata.normalize("NFKD", str(text or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w]+", " ", text).split())
+
+
+class DuplicateIndex:
+    """Content hashes of the records already created
+
+    Each record is reduced to a 64-bit hash of (date, amount in cents,
+    normalized description, category), counting how many records share it.
+    The counts are kept in a dict, so a lookup is O(1) and needs no request,
+    and in a SQLite table so they survive restarts. Counting instead of
+    testing membership keeps legitimate repeats: the second identical line
+    of a statement is only a duplicate if two such records already exist.
+    The fuzzy window also matches the same record on the neighbouring days,
+    e.g. a bank posting an expense one day after it was typed in the form.
+    The stored counts are loaded by the first call that needs them, or by
+    load(), so creating the index does not block startup.
+    """
+
+    def __init__(self, path: Optional[str] = None, window_days: int = 0):
+        """
+        Initialize the index, the stored hashes are loaded when first needed
+        Args:
+            path: SQLite database file, ":memory:" keeps it in memory
+            window_days: Days before and after the record date that are
+            checked by default
+        """
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "duplicates.sqlite3")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.window_days = window_days
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS record_counts "
+                "(hash INTEGER PRIMARY KEY, count INTEGER NOT NULL)"
+            )
+            # Server ids already counted, so a record seen when it is created
+            # and again in a sync is only counted once
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS counted_ids (id TEXT PRIMARY KEY)"
+            )
+        self._counts = {}
+        self._ids = set()
+        self._loaded = False
+        # Held while loading, so concurrent callers wait for the first one
+        self._load_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        self.load()
+        return len(self._counts)
+
+    def load(self):
+        """
+        Load the stored hashes if they were not loaded yet
+        Call it from a worker thread to have them ready before the first check.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if self._loaded:
+                return
+            with self._lock:
+                self._counts.update(
+                    self._conn.execute("SELECT hash, count FROM record_counts")
+                )
+                self._ids.update(
+                    row[0] for row in self._conn.execute("SELECT id FROM counted_ids")
+                )
+            self._loaded = True
+
+    def find(
+        self,
+        record_data: Dict[str, any],
+        window_days: Optional[int] = None,
+        occurrence: int = 1,
+    ) -> Optional[str]:
+        """
+        Look for already created records with the same content
+        Args:
+            record_data: Record data, same structure as in create_record
+            window_days: Overrides the default fuzzy window
+            occurrence: Number of identical records being created, e.g. 2 for
+            the second identical line of a statement
+        Returns:
+            Date of the nearest matching record if at least occurrence of them
+            exist, or None
+        """
+        self.load()
+        window = self.window_days if window_days is None else window_days
+        try:
+            day = date.fromisoformat(str(record_data.get("date")))
+        except ValueError:
+            return None
+        matched_date = None
+        matches = 0
+        # Exact date first, then outwards one day at a time
+        for offset in sorted(range(-window, window + 1), key=abs):
+            candidate = (day + timedelta(days=offset)).isoformat()
+            count = self._counts.get(self._hash(record_data, candidate), 0)
+            if count and matched_date is None:
+                matched_date = candidate
+            matches += count
+        return matched_date if matches >= occurrence else None
+
+    def check(
+        self,
+        record_data: Dict[str, any],
+        window_days: Optional[int] = None,
+        seen: Optional[Dict[int, int]] = None,
+    ):
+        """
+        Args:
+            seen: Records already checked in the same import, updated by the
+            call. The n-th identical one is only a duplicate if n were created.
+        Raises:
+            DuplicateRecordError: If the record was already created
+        """
+        occurrence = 1
+        if seen is not None:
+            key = self._hash(record_data)
+            occurrence = seen[key] = seen.get(key, 0) + 1
+        matched_date = self.find(record_data, window_days, occurrence)
+        if matched_date is not None:
+            raise DuplicateRecordError(record_data, matched_date)
+
+    def mark_seen(self, record_data: Dict[str, any], seen: Dict[int, int]):
+        """
+        Count a record in seen without checking it
+        Used for the lines a resumed import already sent, so the identical
+        lines after them keep their numbering.
+        """
+        key = self._hash(record_data)
+        seen[key] = seen.get(key, 0) + 1
+
+    def add(self, record_data: Dict[str, any], record_id=None):
+        """
+        Count a created record
+        Args:
+            record_data: Record data, same structure as in create_record
+            record_id: Server id, the record is skipped if it was counted
+            before. Taken from record_data if not given.
+        """
+        if record_id is not None:
+            record_data = dict(record_data, id=record_id)
+        self.add_many([record_data])
+
+    def add_many(self, records: Iterable[Dict[str, any]]) -> int:
+        """
+        Count many records, e.g. the ones already stored on the server
+        Records with an "id" that was counted before are skipped. The input is
+        read lazily and stored in batches.
+        Returns:
+            Number of records counted
+        """
+        self.load()
+        added = 0
+        batch = []
+        for record_data in records:
+            record_id = record_data.get("id")
+            batch.append(
+                (self._hash(record_data), None if record_id is None else str(record_id))
+            )
+            if len(batch) >= LOAD_BATCH_SIZE:
+                added += self._store(batch)
+                batch = []
+        if batch:
+            added += self._store(batch)
+        return added
+
+    def clear(self):
+        self.load()
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM record_counts")
+            self._conn.execute("DELETE FROM counted_ids")
+            self._counts.clear()
+            self._ids.clear()
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+    def _store(self, batch) -> int:
+        added = 0
+        with self._lock, self._conn:
+            changed = {}
+            ids = []
+            for value, record_id in batch:
+                if record_id is not None:
+                    if record_id in self._ids:
+                        continue
+                    self._ids.add(record_id)
+                    ids.append((record_id,))
+                changed[value] = self._counts[value] = self._counts.get(value, 0) + 1
+                added += 1
+            if ids:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO counted_ids (id) VALUES (?)", ids
+                )
+            if changed:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO record_counts (hash, count) VALUES (?, ?)",
+                    changed.items(),
+                )
+        return added
+
+    @staticmethod
+    def _hash(record_data: Dict[str, any], day: Optional[str] = None) -> int:
+        try:
+            cents = round(float(record_data.get("amount") or 0) * 100)
+        except (TypeError, ValueError):
+            cents = record_data.get("amount")
+        key = "\x1f".join(
+            (
+                str(day or record_data.get("date") or ""),
+                str(cents),
+                normalize_description(record_data.get("description")),
+                str(record_data.get("category") or ""),
+            )
+        )
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest()
+        # Signed, so it fits in a SQLite INTEGER
+        return int.from_bytes(digest, "big", signed=True)
@@ -1,26 +1,177 @@
+import hashlib
+import threading
+import time
+import uuid
 import requests
-from typing import List, Dict
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count, islice
+from urllib.parse import urlparse
+from typing import Callable, List, Dict, Iterable, Iterator, Optional
+import json_codec
+from category_cache import CategoryCache
+from client_metrics import RequestMetrics
+from duplicate_index import DuplicateIndex
+
+# Status codes meaning the server has no bulk endpoint
+BULK_UNSUPPORTED_STATUS = {404, 405, 501}
+
+# Server errors worth retrying for idempotent requests
+RETRY_STATUS = (429, 502, 503, 504)
+
+# Counters of the current thread, read before and after every request:
+# sockets opened, seconds spent opening them and retries done by urllib3
+_counters = threading.local()
+
+
+def _count(name: str, value=1):
+    setattr(_counters, name, getattr(_counters, name, 0) + value)
+
+
+_COUNTERS = ("connects", "connect_seconds", "retries")
+
+
+class _TimedConnectMixin:
+    """Counts the sockets a connection opens and times connect(), which
+    covers the DNS lookup, the TCP handshake and the TLS one for HTTPS"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            # Failed attempts count too, e.g. a DNS lookup that times out
+            _count("connect_seconds", time.perf_counter() - started)
+        _count("connects")
+
+
+class _CountingHTTPConnection(_TimedConnectMixin, HTTPConnection):
+    pass
+
+
+class _CountingHTTPSConnection(_TimedConnectMixin, HTTPSConnection):
+    pass
+
+
+class _CountingHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _CountingHTTPConnection
+
+
+class _CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _CountingHTTPSConnection
+
+
+class _CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose pools count every socket they open"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": _CountingHTTPConnectionPool,
+            "https": _CountingHTTPSConnectionPool,
+        }
+
+
+class _Retry(Retry):
+    """Retry that never retries a POST
+
+    urllib3 retries connect errors for every method, but POSTs are already
+    retried by ExpensyClient._post, and only when they carry a key.
+    """
+
+    def increment(self, method=None, *args, **kwargs):
+        if method == "POST":
+            # Exhausted at once, raises MaxRetryError with the original error
+            return Retry.increment(self.new(total=0), method, *args, **kwargs)
+        retry = super().increment(method, *args, **kwargs)
+        # Only reached when the request is going to be repeated, counted here
+        # because a request that finally fails has no response to read it from
+        _count("retries")
+        return retry
 
 
 class ExpensyClient:
     """REST client for the Expensy service"""
 
-    def __init__(self, base_url: str = "http://192.168.0.243:8000"):
+    def __init__(
+        self,
+        base_url: str = "http://192.168.0.243:8000",
+        category_cache: Optional[CategoryCache] = None,
+        pool_size: int = 10,
+        connect_timeout: float = 3.05,
+        read_timeout: float = 15.0,
+        retries: int = 3,
+        backoff_factor: float = 0.5,
+        metrics: Optional[RequestMetrics] = None,
+        hooks: Optional[List[Callable[[Dict[str, any]], None]]] = None,
+        duplicates: Optional[DuplicateIndex] = None,
+    ):
         """
         Initialize the REST client
         Args:
             base_url: Base URL of the REST service
+            category_cache: Persistent cache for categories, a default one in
+            the user's home directory is used if not given
+            pool_size: Maximum number of keep-alive connections to the server
+            connect_timeout: Seconds to wait for the connection to open
+            read_timeout: Seconds to wait for the server to answer
+            retries: Retries for GETs and for POSTs with an idempotency key
+            backoff_factor: Base of the exponential wait between retries
+            metrics: Counters updated after every operation
+            hooks: Functions called with the span of every operation, see
+            RequestMetrics for its keys
+            duplicates: Index of the records already created, checked before
+            every POST so duplicates are dropped without a round-trip
         """
         self.base_url = base_url.rstrip("/")
+        self.category_cache = category_cache or CategoryCache()
+        self.timeout = (connect_timeout, read_timeout)
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+        self.metrics = metrics or RequestMetrics()
+        self.hooks = list(hooks or [])
+        self.duplicates = duplicates
+        # Set once a request succeeds, there is a pooled connection to reuse
+        self.connected = False
         self.session = requests.Session()
+        # urllib3 only retries idempotent methods, POSTs are retried in _post
+        # when they carry an idempotency key
+        adapter = _CountingAdapter(
+            pool_connections=1,
+            pool_maxsize=pool_size,
+            max_retries=_Retry(
+                total=retries,
+                backoff_factor=backoff_factor,
+                status_forcelist=RETRY_STATUS,
+                allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+                raise_on_status=False,
+            ),
+        )
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        # None until the first bulk request tells us if the server supports it
+        self.bulk_supported = None
         # Set default headers
         self.session.headers.update(
             {"Content-Type": "application/json", "Accept": "application/json"}
         )
 
-    def get_categories(self) -> List[Dict[str, any]]:
+    def get_cached_categories(self) -> Optional[List[Dict[str, any]]]:
+        """Return the last known categories without any network request"""
+        return self.category_cache.get_categories()
+
+    def get_categories(self, force_refresh: bool = False) -> List[Dict[str, any]]:
         """
         Get available categories from the service
+        The list is served from the persistent cache while it is fresh, and
+        revalidated with ETag/Last-Modified once the TTL expires. If the server
+        can't be reached the last known list is returned.
+        Args:
+            force_refresh: Revalidate with the server even if the cache is fresh
         Returns:
             List of categories with structure:
             [
@@ -40,15 +191,128 @@ class ExpensyClient:
             requests.RequestException: If there's an error communicating with the
             server
         """
+        cache = self.category_cache
+        cached = cache.get_categories()
+        if cached is not None and not force_refresh and cache.is_fresh():
+            cache.hits += 1
+            return cached
         try:
-            response = self.session.get(f"{self.base_url}/api/categories/")
-            response.raise_for_status()
-            return response.json()["results"]
+            with self._span("get_categories", "categories") as span:
+                response = self._request(
+                    span,
+                    "GET",
+                    f"{self.base_url}/api/categories/",
+                    headers=cache.validators(),
+                )
+                if response.status_code == 304 and cached is not None:
+                    cache.revalidations += 1
+                    cache.touch()
+                    return cached
+                response.raise_for_status()
+                page = self._decode(span, response)
+                categories = list(page["results"])
+                # The rest of the list, if the server paginates it
+                if page.get("next"):
+                    for results in self._iter_pages(page["next"]):
+                        categories.extend(results)
         except requests.RequestException as e:
             print(f"Error getting categories: {e}")
+            if cached is not None:
+                # Offline: fall back to the last known list
+                cache.stale_hits += 1
+                return cached
             raise
+        cache.misses += 1
+        cache.store(
+            categories,
+            etag=response.headers.get("ETag"),
+            last_modified=response.headers.get("Last-Modified"),
+        )
+        return categories
 
-    def create_record(self, record_data: Dict[str, any]) -> Dict[str, any]:
+    def iter_categories(self, prefetch: bool = False) -> Iterator[Dict[str, any]]:
+        """
+        Iterate over the categories on the server, page by page
+        Unlike get_categories the cache is not used.
+        Args:
+            prefetch: Download the next page while the current one is consumed
+        Raises:
+            requests.RequestException: If there's an error communicating with the
+            server
+        """
+        for results in self._iter_pages(
+            f"{self.base_url}/api/categories/", prefetch=prefetch
+        ):
+            yield from results
+
+    def iter_records(
+        self,
+        since: Optional[str] = None,
+        page_size: int = 100,
+        prefetch: bool = True,
+    ) -> Iterator[Dict[str, any]]:
+        """
+        Iterate over the records on the server, downloading one page at a time
+        Only the current page (and the next one when prefetching) is kept in
+        memory, so large histories can be synced without loading them whole.
+        Args:
+            since: Only records modified after this ISO 8601 date/time
+            page_size: Records requested per page
+            prefetch: Download the next page while the current one is consumed
+        Returns:
+            Iterator of records with the same structure as in create_record,
+            plus the "id" assigned by the server
+        Raises:
+            requests.RequestException: If there's an error communicating with the
+            server
+        """
+        params = {"page_size": page_size}
+        if since:
+            params["modified_since"] = since
+        for results in self._iter_pages(
+            f"{self.base_url}/api/records/", params=params, prefetch=prefetch
+        ):
+            yield from results
+
+    def _get_json(self, url: str, params: Optional[Dict[str, any]] = None):
+        # Last path segment, e.g. "records" for /api/records/?page=2
+        endpoint = urlparse(url).path.strip("/").split("/")[-1]
+        with self._span("get_page", endpoint) as span:
+            response = self._request(span, "GET", url, params=params)
+            response.raise_for_status()
+            return self._decode(span, response)
+
+    def _iter_pages(
+        self, url: str, params: Optional[Dict[str, any]] = None, prefetch: bool = False
+    ) -> Iterator[List[Dict[str, any]]]:
+        """Yield the results of each page, following the "next" links"""
+        page = self._get_json(url, params)
+        # A plain list means the endpoint is not paginated
+        if isinstance(page, list):
+            yield page
+            return
+        executor = ThreadPoolExecutor(max_workers=1) if prefetch else None
+        try:
+            while True:
+                next_url = page.get("next")
+                pending = None
+                if executor and next_url:
+                    # The "next" link already carries the query parameters
+                    pending = executor.submit(self._get_json, next_url)
+                yield page["results"]
+                if not next_url:
+                    return
+                page = pending.result() if pending else self._get_json(next_url)
+        finally:
+            if executor:
+                executor.shutdown(wait=False)
+
+    def create_record(
+        self,
+        record_data: Dict[str, any],
+        idempotency_key: Optional[str] = None,
+        allow_duplicate: bool = False,
+    ) -> Dict[str, any]:
         """
         Create a new expense/income record
         Args:
@@ -60,10 +324,174 @@ class ExpensyClient:
                     "date": "2024-12-01",
                     "category": 1
                 }
+            idempotency_key: Sent as the Idempotency-Key header so the server
+            can discard retries of a record it already created
+            allow_duplicate: Skip the duplicate index, e.g. when the user
+            confirmed that the repeated record is intended
         Raises:
             requests.RequestException: If there's an error communicating with the
             server
             ValueError: If the record data is not valid
+            DuplicateRecordError: If the same record was already created
+        """
+        self.validate_record(record_data)
+        if self.duplicates is not None and not allow_duplicate:
+            self.duplicates.check(record_data)
+        try:
+            with self._span("create_record", "records") as span:
+                response = self._post(
+                    span,
+                    f"{self.base_url}/api/records/",
+                    json_codec.dumps(record_data),
+                    idempotency_key,
+                )
+                response.raise_for_status()
+                result = self._decode(span, response)
+        except requests.RequestException as e:
+            print(f"Error creating record: {e}")
+            raise
+        if self.duplicates is not None:
+            self.duplicates.add(record_data, self._record_id(result))
+        return result
+
+    def create_records(
+        self,
+        records: Iterable[Dict[str, any]],
+        batch_size: int = 50,
+        max_workers: int = 4,
+        idempotency_keys: Optional[Iterable[str]] = None,
+        occurrences: Optional[Dict[int, int]] = None,
+    ) -> Iterator[Dict[str, any]]:
+        """
+        Create many records, reading the input lazily in batches
+        Each batch is sent to the bulk endpoint when the server has one, and
+        otherwise as concurrent single POSTs over the pooled session. A failed
+        record never aborts the rest of the import, and records found in the
+        duplicate index come back with a DuplicateRecordError without being sent.
+        Identical records in the input are counted, so they are only duplicates
+        if the index holds as many of them, wherever the batches are cut.
+        Args:
+            records: Iterable of record data, same structure as in create_record
+            batch_size: Number of records read and sent at a time
+            max_workers: Single POSTs in flight when there is no bulk endpoint
+            idempotency_keys: One per record, so the server can discard
+            retries and resent batches. Random ones are used if not given.
+            occurrences: Records checked so far, see DuplicateIndex.check.
+            Pass the same dict to continue an import over several calls.
+        Returns:
+            Iterator with one result per record, in input order:
+                {
+                    "index": 0,
+                    "record": {...},
+                    "result": {...} or None,
+                    "error": None or Exception
+                }
+        """
+        if idempotency_keys is None:
+            idempotency_keys = iter(lambda: str(uuid.uuid4()), None)
+        iterator = zip(count(), records, idempotency_keys)
+        if occurrences is None:
+            occurrences = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while True:
+                batch = list(islice(iterator, batch_size))
+                if not batch:
+                    return
+                yield from self._create_batch(batch, executor, occurrences)
+
+    def _create_batch(self, batch, executor, occurrences) -> List[Dict[str, any]]:
+        results = {}
+        valid = []
+        for index, record_data, key in batch:
+            try:
+                self.validate_record(record_data)
+                if self.duplicates is not None:
+                    self.duplicates.check(record_data, seen=occurrences)
+                valid.append((index, record_data, key))
+            except ValueError as e:
+                results[index] = self._batch_result(index, record_data, error=e)
+        if valid and self.bulk_supported is not False:
+            bulk_results = self._post_bulk(valid)
+            if bulk_results is not None:
+                results.update(bulk_results)
+                valid = []
+        if valid:
+            for index, record_data, result, error in executor.map(
+                self._post_single, valid
+            ):
+                results[index] = self._batch_result(index, record_data, result, error)
+        return [results[index] for index, _, _ in batch]
+
+    def _post_bulk(self, batch) -> Optional[Dict[int, Dict[str, any]]]:
+        """Send a batch to the bulk endpoint, None if the server has none"""
+        try:
+            with self._span("create_records", "records_bulk") as span:
+                # Derived from the record keys, so a resent batch has the same one
+                batch_key = hashlib.sha256(
+                    "\n".join(key for _, _, key in batch).encode("utf-8")
+                ).hexdigest()
+                response = self._post(
+                    span,
+                    f"{self.base_url}/api/records/bulk/",
+                    json_codec.dumps([record_data for _, record_data, _ in batch]),
+                    batch_key,
+                )
+                if response.status_code in BULK_UNSUPPORTED_STATUS:
+                    self.bulk_supported = False
+                    return None
+                response.raise_for_status()
+                items = self._decode(span, response)
+                if isinstance(items, dict):
+                    items = items.get("results")
+                if not isinstance(items, list) or len(items) != len(batch):
+                    raise ValueError("Unexpected response from the bulk endpoint")
+        except (requests.RequestException, ValueError) as e:
+            print(f"Error creating records: {e}")
+            return {
+                index: self._batch_result(index, record_data, error=e)
+                for index, record_data, _ in batch
+            }
+        self.bulk_supported = True
+        results = {}
+        for (index, record_data, _), item in zip(batch, items):
+            if isinstance(item, dict) and item.get("error"):
+                error = ValueError(str(item["error"]))
+                results[index] = self._batch_result(index, record_data, error=error)
+            else:
+                results[index] = self._batch_result(index, record_data, item)
+        if self.duplicates is not None:
+            self.duplicates.add_many(
+                dict(item["record"], id=self._record_id(item["result"]))
+                for item in results.values()
+                if item["error"] is None
+            )
+        return results
+
+    def _post_single(self, item):
+        index, record_data, key = item
+        try:
+            # Already checked against the index and the rest of the batch
+            result = self.create_record(
+                record_data, idempotency_key=key, allow_duplicate=True
+            )
+            return index, record_data, result, None
+        except (requests.RequestException, ValueError) as e:
+            return index, record_data, None, e
+
+    @staticmethod
+    def _record_id(result):
+        return result.get("id") if isinstance(result, dict) else None
+
+    @staticmethod
+    def _batch_result(index, record_data, result=None, error=None) -> Dict[str, any]:
+        return {"index": index, "record": record_data, "result": result, "error": error}
+
+    @staticmethod
+    def validate_record(record_data: Dict[str, any]):
+        """
+        Check a record before sending it
+        Raises:
+            ValueError: If the record data is not valid
         """
         # Validate required fields
         required_fields = ["description", "amount", "source", "date", "category"]
@@ -73,19 +501,127 @@ class ExpensyClient:
         # Validate amount
         try:
             amount = float(record_data["amount"])
-            if amount <= 0:
-                raise ValueError("Amount must be greater than 0")
         except (ValueError, TypeError):
             raise ValueError("Amount must be a valid number")
+        if amount <= 0:
+            raise ValueError("Amount must be greater than 0")
+
+    def warm_up(self):
+        """
+        Open a pooled connection ahead of the first real request, so saving a
+        record does not pay the TCP/TLS handshake. Errors are ignored.
+        """
+        if self.connected:
+            return
         try:
-            response = self.session.post(
-                f"{self.base_url}/api/records/", json=record_data
-            )
-            response.raise_for_status()
-            return response.json()
+            with self._span("warm_up", "warm_up") as span:
+                self._request(span, "HEAD", f"{self.base_url}/api/")
         except requests.RequestException as e:
-            print(f"Error creating record: {e}")
+            print(f"Error warming up connection: {e}")
+
+    @contextmanager
+    def _span(self, name: str, endpoint: str):
+        """Measure an operation and report it to the metrics and hooks"""
+        span = {
+            "name": name,
+            "endpoint": endpoint,
+            "start": time.time(),
+            "duration": 0.0,
+            "connect": 0.0,
+            "wait": 0.0,
+            "transfer": 0.0,
+            "decode": 0.0,
+            "requests": 0,
+            "retries": 0,
+            "new_connections": 0,
+            "bytes_sent": 0,
+            "bytes_received": 0,
+            "status": None,
+            "error": None,
+        }
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span["error"] = str(e) or type(e).__name__
             raise
+        finally:
+            span["duration"] = time.perf_counter() - started
+            self.metrics.record(span)
+            for hook in self.hooks:
+                try:
+                    hook(span)
+                except Exception as e:
+                    print(f"Error in client hook: {e}")
+
+    def _post(
+        self,
+        span: Dict[str, any],
+        url: str,
+        data: bytes,
+        idempotency_key: Optional[str] = None,
+    ):
+        """
+        Send a POST, retried with backoff only if it carries an idempotency key
+        Connection errors and RETRY_STATUS answers are retried.
+        """
+        headers = {"Idempotency-Key": idempotency_key} if idempotency_key else {}
+        # Without a key a retry could create the records twice
+        attempts = self.retries + 1 if idempotency_key else 1
+        for attempt in range(attempts):
+            if attempt:
+                span["retries"] += 1
+                time.sleep(self.backoff_factor * 2 ** (attempt - 1))
+            try:
+                response = self._request(span, "POST", url, data=data, headers=headers)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt == attempts - 1:
+                    raise
+                continue
+            if response.status_code not in RETRY_STATUS:
+                break
+        return response
+
+    def _request(self, span: Dict[str, any], method: str, url: str, **kwargs):
+        """Send a request on the pooled session and add its figures to span"""
+        kwargs.setdefault("timeout", self.timeout)
+        before = [getattr(_counters, name, 0) for name in _COUNTERS]
+        started = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        finally:
+            # Also for attempts that raise, e.g. a connect error after retries
+            total = time.perf_counter() - started
+            connects, connect_seconds, retries = (
+                getattr(_counters, name, 0) - value
+                for name, value in zip(_COUNTERS, before)
+            )
+            span["requests"] += 1
+            span["retries"] += retries
+            span["new_connections"] += connects
+            span["connect"] += connect_seconds
+        self.connected = True
+        # elapsed stops when the headers are parsed, the rest is the body.
+        # What is left after opening connections is the server time.
+        headers = min(response.elapsed.total_seconds(), total)
+        span["wait"] += max(headers - connect_seconds, 0.0)
+        span["transfer"] += total - headers
+        body = response.request.body
+        span["bytes_sent"] += len(body) if body else 0
+        span["bytes_received"] += len(response.content or b"")
+        span["status"] = response.status_code
+        return response
+
+    @staticmethod
+    def _decode(span: Dict[str, any], response):
+        started = time.perf_counter()
+        try:
+            # Straight from the body bytes, without building response.text
+            return json_codec.loads(response.content)
+        except json_codec.DecodeError as e:
+            raise requests.exceptions.InvalidJSONError(str(e), response=response)
+        finally:
+            span["decode"] += time.perf_counter() - started
 
     def close(self):
         """Close the client session"""
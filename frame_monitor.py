@@ -0,0 +1,164 @@
+import functools
+import json
+import os
+import time
+from collections import deque
+from typing import List, Dict, Optional
+
+
+class FrameMonitor:
+    """Measures frame times and attributes slow frames to the callbacks that ran
+
+    It is disabled unless EXPENSY_FRAME_MONITOR=1 (shows an overlay with the
+    stats) or EXPENSY_FRAME_LOG is set (JSON lines with every long frame and
+    a summary on stop). The log works without the overlay for headless runs.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        overlay: bool = False,
+        log_path: Optional[str] = None,
+        long_frame: float = 1 / 30,
+        history: int = 600,
+    ):
+        """
+        Initialize the monitor
+        Args:
+            enabled: Measure frames and traced callbacks
+            overlay: Show the stats on top of the app
+            log_path: File where long frames and the summary are appended
+            long_frame: Seconds from which a frame is reported as long
+            history: Number of recent frames used for the percentiles
+        """
+        self.enabled = enabled
+        self.overlay = overlay
+        self.log_path = log_path
+        self.long_frame = long_frame
+        self.durations = deque(maxlen=history)
+        self.long_frames = deque(maxlen=100)
+        self.long_frame_count = 0
+        self.frame_count = 0
+        # Traced callbacks that ran since the last frame
+        self._callbacks = []
+        self._label = None
+
+    @classmethod
+    def from_environ(cls) -> "FrameMonitor":
+        """Create the monitor configured by the environment variables"""
+        overlay = os.environ.get("EXPENSY_FRAME_MONITOR") == "1"
+        log_path = os.environ.get("EXPENSY_FRAME_LOG")
+        long_frame = os.environ.get("EXPENSY_LONG_FRAME_MS")
+        return cls(
+            enabled=overlay or bool(log_path),
+            overlay=overlay,
+            log_path=log_path,
+            long_frame=float(long_frame) / 1000 if long_frame else 1 / 30,
+        )
+
+    def trace(self, name: str):
+        """
+        Decorator that records how long a UI callback takes
+        When the monitor is disabled the function is returned untouched.
+        """
+
+        def decorator(func):
+            if not self.enabled:
+                return func
+
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self._callbacks.append((name, time.perf_counter() - started))
+
+            return wrapper
+
+        return decorator
+
+    def record_frame(self, duration: float):
+        """Register the duration of a frame and the callbacks run in it"""
+        callbacks, self._callbacks = self._callbacks, []
+        self.frame_count += 1
+        self.durations.append(duration)
+        if duration < self.long_frame:
+            return
+        self.long_frame_count += 1
+        entry = {
+            "event": "long_frame",
+            "time": time.time(),
+            "duration": duration,
+            "callbacks": [
+                {"name": name, "duration": elapsed} for name, elapsed in callbacks
+            ],
+        }
+        self.long_frames.append(entry)
+        self._log(entry)
+
+    def stats(self) -> Dict[str, any]:
+        """Frame time percentiles over the recent history, in seconds"""
+        durations = sorted(self.durations)
+        return {
+            "frames": self.frame_count,
+            "p50": self._percentile(durations, 50),
+            "p95": self._percentile(durations, 95),
+            "p99": self._percentile(durations, 99),
+            "max": durations[-1] if durations else 0.0,
+            "long_frames": self.long_frame_count,
+            "long_frame_threshold": self.long_frame,
+        }
+
+    def start(self):
+        """Start sampling frames with the Kivy clock"""
+        if not self.enabled:
+            return
+        from kivy.clock import Clock
+
+        Clock.schedule_interval(lambda dt: self.record_frame(dt), 0)
+        if self.overlay:
+            self._show_overlay()
+            Clock.schedule_interval(self._refresh_overlay, 1)
+
+    def stop(self):
+        """Write the summary to the log"""
+        if self.enabled:
+            self._log(dict(self.stats(), event="summary", time=time.time()))
+
+    def _show_overlay(self):
+        from kivy.core.window import Window
+        from kivy.uix.label import Label
+
+        self._label = Label(
+            size_hint=(None, None),
+            size=(Window.width, 20),
+            pos=(0, Window.height - 20),
+            font_size="11sp",
+            color=(1, 1, 0, 1),
+            halign="left",
+        )
+        Window.add_widget(self._label)
+
+    def _refresh_overlay(self, dt):
+        stats = self.stats()
+        self._label.text = (
+            f"p50 {stats['p50'] * 1000:.1f}ms  p95 {stats['p95'] * 1000:.1f}ms  "
+            f"p99 {stats['p99'] * 1000:.1f}ms  long {stats['long_frames']}"
+        )
+
+    def _log(self, entry: Dict[str, any]):
+        if not self.log_path:
+            return
+        try:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry) + "\n")
+        except OSError as e:
+            print(f"Error writing frame log: {e}")
+
+    @staticmethod
+    def _percentile(durations: List[float], percent: float) -> float:
+        if not durations:
+            return 0.0
+        index = min(len(durations) - 1, int(len(durations) * percent / 100))
+        return durations[index]
@@ -0,0 +1,38 @@
+"""JSON encoding and decoding with the fastest library installed
+
+orjson is used when available, then msgspec, and the standard json module
+otherwise. dumps always returns UTF-8 bytes and loads accepts bytes or str.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+if orjson is not None:
+    BACKEND = "orjson"
+    DecodeError = orjson.JSONDecodeError
+    dumps = orjson.dumps
+    loads = orjson.loads
+elif msgspec is not None:
+    BACKEND = "msgspec"
+    DecodeError = msgspec.DecodeError
+    dumps = msgspec.json.Encoder().encode
+    loads = msgspec.json.Decoder().decode
+else:
+    BACKEND = "json"
+    DecodeError = ValueError
+
+    def dumps(obj) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode(
+            "utf-8"
+        )
+
+    loads = json.loads
@@ -0,0 +1,235 @@
+import os
+import sqlite3
+import threading
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+import json_codec
+from category_cache import DEFAULT_CACHE_DIR
+
+
+class RecordLedger:
+    """Local SQLite mirror of the records stored on the server
+
+    History, search and totals are answered from here without touching the
+    network. The mirror is kept up to date incrementally: each sync only asks
+    for the records modified after the last cursor.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the ledger
+        Args:
+            path: SQLite database file, ":memory:" keeps it in memory
+        """
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "ledger.sqlite3")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    id INTEGER PRIMARY KEY,
+                    description TEXT NOT NULL,
+                    amount REAL NOT NULL,
+                    date TEXT NOT NULL,
+                    category INTEGER,
+                    source TEXT,
+                    modified TEXT,
+                    payload TEXT NOT NULL
+                )
+                """
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS records_date ON records (date)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS records_category "
+                "ON records (category, date)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS records_modified ON records (modified)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state "
+                "(key TEXT PRIMARY KEY, value TEXT)"
+            )
+
+    @property
+    def cursor(self) -> Optional[str]:
+        """Modification date of the newest record synced so far"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM sync_state WHERE key = 'cursor'"
+            ).fetchone()
+        return row[0] if row else None
+
+    def upsert(self, records: Iterable[Dict[str, any]], cursor: Optional[str] = None):
+        """
+        Insert or update records coming from the server
+        Args:
+            records: Records with the "id" assigned by the server
+            cursor: New sync cursor, saved in the same transaction so an
+            interrupted sync resumes from the last stored page
+        """
+        rows = [
+            (
+                record["id"],
+                record.get("description", ""),
+                float(record.get("amount", 0)),
+                record.get("date", ""),
+                record.get("category"),
+                record.get("source"),
+                record.get("modified"),
+                json_codec.dumps(record).decode("utf-8"),
+            )
+            for record in records
+            if record.get("id") is not None
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO records (id, description, amount, date, "
+                "category, source, modified, payload) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            if cursor:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sync_state (key, value) "
+                    "VALUES ('cursor', ?)",
+                    (cursor,),
+                )
+
+    def sync(self, client, page_size: int = 200) -> int:
+        """
+        Download the records modified since the last sync
+        The API returns them ordered by modification date, so the cursor is
+        advanced page by page and an interrupted sync can be resumed.
+        Args:
+            client: ExpensyClient used to list the records
+            page_size: Records stored per transaction
+        Returns:
+            Number of records downloaded
+        Raises:
+            requests.RequestException: If there's an error communicating with the
+            server
+        """
+        cursor = self.cursor
+        count = 0
+        batch = []
+        for record in client.iter_records(since=cursor, page_size=page_size):
+            batch.append(record)
+            if record.get("modified") and (not cursor or record["modified"] > cursor):
+                cursor = record["modified"]
+            if len(batch) >= page_size:
+                self.upsert(batch, cursor)
+                count += len(batch)
+                batch = []
+        if batch:
+            self.upsert(batch, cursor)
+            count += len(batch)
+        return count
+
+    def count(self) -> int:
+        """Number of records in the mirror"""
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def iter_records(
+        self, modified_after: Optional[str] = None, batch_size: int = 1000
+    ) -> Iterator[Dict[str, any]]:
+        """
+        Read all the records lazily, in batches ordered by id
+        Args:
+            modified_after: Only the records modified after this sync cursor
+            batch_size: Records read per query
+        """
+        last_id = None
+        while True:
+            sql = "SELECT id, payload FROM records WHERE id > ?"
+            params = [-1 if last_id is None else last_id]
+            if modified_after:
+                sql += " AND modified > ?"
+                params.append(modified_after)
+            with self._lock:
+                rows = self._conn.execute(
+                    sql + " ORDER BY id LIMIT ?", params + [batch_size]
+                ).fetchall()
+            for _, payload in rows:
+                yield json_codec.loads(payload)
+            if len(rows) < batch_size:
+                return
+            last_id = rows[-1][0]
+
+    def columns(
+        self, after_id: Optional[int] = None, modified_after: Optional[str] = None
+    ) -> List[Tuple[int, Optional[int], int, Optional[int]]]:
+        """
+        (id, day, cents, category) of the records, converted by SQLite
+        Args:
+            after_id: Only the records with a greater id or, if given, modified
+            after modified_after. All of them if not given.
+            modified_after: Sync cursor of the previous call
+        Returns:
+            Rows, where day counts the days since 1970-01-01 and is None if the
+            date is not valid
+        """
+        sql = (
+            "SELECT id, CAST(julianday(date) - 2440587.5 AS INTEGER), "
+            "CAST(ROUND(amount * 100) AS INTEGER), category FROM records"
+        )
+        params = []
+        if after_id is not None:
+            sql += " WHERE id > ?"
+            params.append(after_id)
+            if modified_after:
+                sql += " OR modified > ?"
+                params.append(modified_after)
+        with self._lock:
+            # Unordered, ORDER BY would keep SQLite from using both indexes
+            return self._conn.execute(sql, params).fetchall()
+
+    def recent(self, limit: int = 50, offset: int = 0) -> List[Dict[str, any]]:
+        """Records ordered from the newest date to the oldest"""
+        return self._query(
+            "SELECT payload FROM records ORDER BY date DESC, id DESC "
+            "LIMIT ? OFFSET ?",
+            (limit, offset),
+        )
+
+    def search(self, text: str, limit: int = 50) -> List[Dict[str, any]]:
+        """Records whose description contains the given text"""
+        return self._query(
+            "SELECT payload FROM records WHERE description LIKE ? "
+            "ORDER BY date DESC, id DESC LIMIT ?",
+            (f"%{text}%", limit),
+        )
+
+    def totals_by_category(
+        self, start: Optional[str] = None, end: Optional[str] = None
+    ) -> Dict[int, float]:
+        """
+        Sum of the amounts per category
+        Args:
+            start: First date included, in YYYY-MM-DD format
+            end: Last date included, in YYYY-MM-DD format
+        """
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT category, SUM(amount) FROM records "
+                "WHERE date >= ? AND date <= ? GROUP BY category",
+                (start or "", end or "9999-12-31"),
+            ).fetchall()
+        return dict(rows)
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+    def _query(self, sql: str, params) -> List[Dict[str, any]]:
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [json_codec.loads(row[0]) for row in rows]
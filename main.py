@@ -1,20 +1,48 @@
+import os
+import sys
+import threading
+from frame_monitor import FrameMonitor
+from startup_profiler import StartupProfiler
+
+# Opt-in startup timing, see startup_profiler.py
+startup = StartupProfiler.from_environ()
+# Opt-in frame time overlay and log, see frame_monitor.py
+frame_monitor = FrameMonitor.from_environ()
+
 from kivy.app import App
+from kivy.clock import Clock
+from kivy.lang import Builder
+from kivy.properties import ColorProperty, NumericProperty, StringProperty
 from kivy.uix.boxlayout import BoxLayout
 from kivy.uix.gridlayout import GridLayout
 from kivy.uix.label import Label
 from kivy.uix.textinput import TextInput
 from kivy.uix.button import Button
+from kivy.uix.dropdown import DropDown
 from kivy.uix.spinner import Spinner
 from kivy.uix.togglebutton import ToggleButton
 from kivy.uix.popup import Popup
 from kivy.uix.scrollview import ScrollView
-from kivy.graphics import Color, RoundedRectangle, Line
+from kivy.uix.recycleview import RecycleView
+from kivy.uix.recycleview.views import RecycleDataViewBehavior
+from kivy.uix.recycleboxlayout import RecycleBoxLayout
+from kivy.uix.screenmanager import ScreenManager, Screen, NoTransition
+from kivy.graphics import Color, RoundedRectangle, Line, Rectangle
 from kivy.metrics import dp, sp
 from kivy.config import Config
 from kivy.utils import get_color_from_hex
 from datetime import datetime, date
 import calendar
+from category_suggester import CategorySuggester
+from client_metrics import JsonLinesSpanExporter
+from description_index import DescriptionIndex
+from duplicate_index import DuplicateIndex
 from expensy_client import ExpensyClient
+from ledger import RecordLedger
+from record_submitter import RecordSubmitter
+from spending_analytics import ANALYTICS_AVAILABLE, SpendingAnalytics
+
+startup.mark("imports")
 
 # Color palette - Dark modern theme
 COLORS = {
@@ -34,6 +62,27 @@ COLORS = {
 # Categorías como constantes
 CATEGORIES = ["Hogar", "Comidas y bebidas", "Salud y cuidado personal", "Supermercado"]
 
+# Categorías por defecto mientras no se cargan las de la API
+DEFAULT_CATEGORIES = [
+    {"id": i, "name": name} for i, name in enumerate(CATEGORIES, start=1)
+]
+
+# Nombres de los meses para el selector de fecha
+MONTHS_ES = [
+    "Enero",
+    "Febrero",
+    "Marzo",
+    "Abril",
+    "Mayo",
+    "Junio",
+    "Julio",
+    "Agosto",
+    "Septiembre",
+    "Octubre",
+    "Noviembre",
+    "Diciembre",
+]
+
 # Fuente de los datos
 SOURCE_FIELD = "ingreso manual"
 
@@ -42,6 +91,70 @@ Config.set("graphics", "width", "375")
 Config.set("graphics", "height", "667")
 Config.set("graphics", "resizable", False)
 Config.set("graphics", "clear_color", "#1a1a1a")
+startup.mark("config")
+
+
+def run_on_main_thread(callback):
+    """Ejecutar un callback en el hilo principal de Kivy"""
+    Clock.schedule_once(lambda dt: callback())
+
+
+# Temas de los botones, "secondary" usa el color del borde
+BUTTON_THEMES = {
+    "primary": "primary",
+    "success": "success",
+    "danger": "danger",
+    "secondary": "border",
+}
+
+# Estilo de los botones: los colores se recalculan por bindings de propiedades
+Builder.load_string(
+    """
+<ModernButton,ModernToggleButton>:
+    background_normal: ""
+    background_down: ""
+    font_size: sp(16)
+    bold: True
+    canvas.before:
+        Color:
+            rgba: self.background_color
+        RoundedRectangle:
+            pos: self.pos
+            size: self.size
+            radius: [self.radius]
+        Color:
+            rgba: self.border_color
+        Line:
+            width: 1
+            rounded_rectangle: (self.x, self.y, self.width, self.height, self.radius)
+
+<ModernButton>:
+    background_color: self.pressed_color if self.state == "down" else self.base_color
+
+<ModernToggleButton>:
+    background_color: self.base_color if self.state == "down" else self.normal_color
+"""
+)
+
+
+def darken(color, factor=0.8):
+    """Color más oscuro para el estado presionado"""
+    return [c * factor for c in color[:3]] + [color[3]]
+
+
+class ThemedButtonBehavior:
+    """Colores de tema compartidos por los botones, el dibujo está en KV"""
+
+    theme = StringProperty("primary")
+    base_color = ColorProperty(COLORS["primary"])
+    pressed_color = ColorProperty(darken(COLORS["primary"]))
+    normal_color = ColorProperty(COLORS["input_background"])
+    border_color = ColorProperty([0, 0, 0, 0])
+    radius = NumericProperty(dp(8))
+
+    def on_theme(self, instance, theme):
+        self.base_color = COLORS[BUTTON_THEMES.get(theme, theme)]
+        self.pressed_color = darken(self.base_color)
 
 
 class ModernCard(BoxLayout):
@@ -63,7 +176,43 @@ class ModernCard(BoxLayout):
         self.rect.size = self.size
 
 
-class ModernTextInput(TextInput):
+class ModernStyleMixin:
+    """Fondo redondeado y borde que se crean una vez y se actualizan en el sitio
+
+    Los cambios de posición, tamaño o estado solo modifican pos, size, rgba y
+    width de las instrucciones existentes, sin limpiar el canvas.
+    """
+
+    def init_style(self, background=None, border=None, radius=dp(8)):
+        """Crear las instrucciones de canvas del widget"""
+        self.style_radius = radius
+        with self.canvas.before:
+            self.bg_color = Color(*(background or (0, 0, 0, 0)))
+            self.bg_rect = RoundedRectangle(
+                pos=self.pos, size=self.size, radius=[radius]
+            )
+            self.border_color = Color(*(border or (0, 0, 0, 0)))
+            self.border_line = Line(
+                width=1, rounded_rectangle=(*self.pos, *self.size, radius)
+            )
+        self.bind(pos=self.update_geometry, size=self.update_geometry)
+
+    def update_geometry(self, *args):
+        self.bg_rect.pos = self.pos
+        self.bg_rect.size = self.size
+        self.border_line.rounded_rectangle = (*self.pos, *self.size, self.style_radius)
+
+    def set_style(self, background=None, border=None, border_width=None):
+        """Cambiar colores y grosor del borde sin crear instrucciones nuevas"""
+        if background is not None:
+            self.bg_color.rgba = background
+        if border is not None:
+            self.border_color.rgba = border
+        if border_width is not None:
+            self.border_line.width = border_width
+
+
+class ModernTextInput(ModernStyleMixin, TextInput):
     """Modern styled text input"""
 
     def __init__(self, **kwargs):
@@ -75,100 +224,27 @@ class ModernTextInput(TextInput):
         self.padding = [dp(15), dp(12)]
         self.font_size = sp(16)
 
-        with self.canvas.before:
-            Color(*COLORS["border"])
-            self.border_line = Line(width=1)
-
-        self.bind(pos=self.update_border, size=self.update_border)
+        # Solo el borde, el fondo lo dibuja el propio TextInput
+        self.init_style(border=COLORS["border"])
         self.bind(focus=self.on_focus_change)
 
-    def update_border(self, *args):
-        self.border_line.rounded_rectangle = (*self.pos, *self.size, dp(8))
-
     def on_focus_change(self, instance, focus):
-        with self.canvas.before:
-            if focus:
-                Color(*COLORS["primary"])
-            else:
-                Color(*COLORS["border"])
-            self.border_line = Line(width=2 if focus else 1)
-            self.border_line.rounded_rectangle = (*self.pos, *self.size, dp(8))
+        if focus:
+            self.set_style(border=COLORS["primary"], border_width=2)
+        else:
+            self.set_style(border=COLORS["border"], border_width=1)
 
 
-class SimpleModernButton(Button):
-    """Ultra-simple modern button that always works"""
+class ModernButton(ThemedButtonBehavior, Button):
+    """Modern styled button, themed with the button_type colour"""
 
     def __init__(self, button_type="primary", **kwargs):
+        kwargs.setdefault("theme", button_type)
         super().__init__(**kwargs)
 
-        color_map = {
-            "primary": COLORS["primary"],
-            "success": COLORS["success"],
-            "danger": COLORS["danger"],
-            "secondary": COLORS["border"],
-        }
-
-        # Simple approach - just use background_color
-        self.background_normal = ""
-        self.background_down = ""
-        self.color = COLORS["text_primary"]
-        self.font_size = sp(16)
-        self.bold = True
-
-        # Set the background color directly
-        self.background_color = color_map.get(button_type, COLORS["primary"])
-
-
-class ModernButton(SimpleModernButton):
-    """Modern styled button with canvas rendering"""
-
-    def __init__(self, button_type="primary", **kwargs):
-        super().__init__(button_type, **kwargs)
-
-        # Store base color for canvas rendering
-        color_map = {
-            "primary": COLORS["primary"],
-            "success": COLORS["success"],
-            "danger": COLORS["danger"],
-            "secondary": COLORS["border"],
-        }
-        self.base_color = color_map.get(button_type, COLORS["primary"])
-
-        # Try canvas rendering, fallback to background_color
-        try:
-            self.bind(pos=self.update_canvas, size=self.update_canvas)
-            self.bind(state=self.update_canvas)
-
-            from kivy.clock import Clock
-
-            Clock.schedule_once(self.update_canvas, 0.1)
-        except Exception:
-            # If canvas fails, keep the simple background_color
-            pass
-
-    def update_canvas(self, *args):
-        """Try to draw with canvas, fallback to background_color"""
-        try:
-            if self.width <= 1 or self.height <= 1:
-                return
-
-            self.canvas.before.clear()
-            with self.canvas.before:
-                if self.state == "down":
-                    pressed_color = [c * 0.8 for c in self.base_color[:3]] + [
-                        self.base_color[3]
-                    ]
-                    Color(*pressed_color)
-                    self.background_color = pressed_color
-                else:
-                    Color(*self.base_color)
-                    self.background_color = self.base_color
-                self.bg_rect = RoundedRectangle(
-                    pos=(self.x, self.y), size=(self.width, self.height), radius=[dp(8)]
-                )
-        except Exception:
-            # Canvas failed, ensure background_color is set
-            self.background_color = self.base_color
+    def set_button_type(self, button_type):
+        """Cambiar el color del botón sin recrearlo"""
+        self.theme = button_type
 
 
 class ModernLabel(Label):
@@ -193,7 +269,7 @@ class ModernLabel(Label):
             self.font_size = sp(16)
 
 
-class ModernSpinner(Spinner):
+class ModernSpinner(ModernStyleMixin, Spinner):
     """Modern styled spinner"""
 
     def __init__(self, **kwargs):
@@ -208,196 +284,68 @@ class ModernSpinner(Spinner):
         self.padding = [dp(15), dp(12)]
 
         # Set background and border
-        self.canvas.before.clear()
-        with self.canvas.before:
-            Color(*COLORS["input_background"])
-            self.bg_rect = RoundedRectangle(
-                pos=self.pos, size=self.size, radius=[dp(8)]
-            )
-            Color(*COLORS["border"])
-            self.border_line = Line(width=1)
-
-        self.bind(pos=self.update_canvas, size=self.update_canvas)
+        self.init_style(
+            background=COLORS["input_background"], border=COLORS["border"]
+        )
         self.bind(text_size=self.update_text_size)
-        # Schedule canvas update after widget is built
-        from kivy.clock import Clock
-
-        Clock.schedule_once(lambda dt: self.update_canvas(), 0.1)
-
-    def update_canvas(self, *args):
-        # Only update if widget has been sized
-        if self.width <= 1 or self.height <= 1:
-            return
-        self.canvas.before.clear()
-        with self.canvas.before:
-            Color(*COLORS["input_background"])
-            self.bg_rect = RoundedRectangle(
-                pos=(self.x, self.y), size=(self.width, self.height), radius=[dp(8)]
-            )
-            Color(*COLORS["border"])
-            self.border_line = Line(width=1)
-            self.border_line.rounded_rectangle = (
-                self.x,
-                self.y,
-                self.width,
-                self.height,
-                dp(8),
-            )
 
     def update_text_size(self, *args):
         if self.width > 0:
             self.text_size = (self.width - dp(30), None)
 
 
-class ModernToggleButton(ToggleButton):
-    """Modern styled toggle button with clear selection state"""
-
-    def __init__(self, **kwargs):
-        super().__init__(**kwargs)
-        self.background_normal = ""
-        self.background_down = ""
-        self.color = COLORS["text_primary"]
-        self.font_size = sp(16)
-        self.bold = True
-
-        # Set initial colors based on state
-        self.update_colors()
-
-        self.bind(pos=self.update_canvas, size=self.update_canvas)
-        self.bind(state=self.update_canvas)
-        # Schedule canvas update after widget is built
-        from kivy.clock import Clock
-
-        Clock.schedule_once(self.update_canvas, 0.1)
-
-    def update_colors(self):
-        """Update colors based on toggle state"""
-        if self.state == "down":
-            # Selected state - bright blue
-            self.background_color = COLORS["primary"]
-        else:
-            # Unselected state - dark background
-            self.background_color = COLORS["input_background"]
-
-    def update_canvas(self, *args):
-        """Update canvas and background color"""
-        # Update background color first (guaranteed fallback)
-        self.update_colors()
-
-        # Only update canvas if widget has been sized
-        if self.width <= 1 or self.height <= 1:
-            return
-        # Try canvas rendering for rounded corners
-        try:
-            self.canvas.before.clear()
-            with self.canvas.before:
-                # Background color based on state
-                if self.state == "down":
-                    Color(*COLORS["primary"])
-                else:
-                    Color(*COLORS["input_background"])
-
-                self.bg_rect = RoundedRectangle(
-                    pos=(self.x, self.y), size=(self.width, self.height), radius=[dp(8)]
-                )
-
-                # Border
-                Color(*COLORS["border"])
-                self.border_rect = Line(width=1)
-                self.border_rect.rounded_rectangle = (
-                    self.x,
-                    self.y,
-                    self.width,
-                    self.height,
-                    dp(8),
-                )
-        except Exception:
-            # Canvas failed, background_color is already set
-            pass
-
-
-class ModernExpenseToggle(ModernToggleButton):
-    """Toggle button specifically for expenses (red theme)"""
+class SuggestionDropDown(DropDown):
+    """Lista de sugerencias con un número fijo de filas que se reutilizan
 
-    def update_colors(self):
-        """Update colors with expense-specific theme"""
-        if self.state == "down":
-            # Selected expense - red/danger color
-            self.background_color = COLORS["danger"]
-        else:
-            # Unselected state - dark background
-            self.background_color = COLORS["input_background"]
+    Cada actualización solo cambia el texto y la altura de las filas, no se
+    crean widgets mientras el usuario escribe.
+    """
 
-    def update_canvas(self, *args):
-        """Update canvas with expense colors"""
-        self.update_colors()
-        if self.width <= 1 or self.height <= 1:
+    def __init__(self, rows=5, row_height=dp(40), **kwargs):
+        kwargs.setdefault("max_height", rows * row_height)
+        super().__init__(**kwargs)
+        self.row_height = row_height
+        self.rows = []
+        for _ in range(rows):
+            row = ModernButton(
+                button_type="secondary",
+                size_hint_y=None,
+                height=row_height,
+                halign="left",
+                bold=False,
+                font_size=sp(14),
+                shorten=True,
+            )
+            row.bind(width=self.update_text_width)
+            row.bind(on_release=lambda row: self.select(row.text))
+            self.rows.append(row)
+            self.add_widget(row)
+
+    def show(self, widget, suggestions):
+        """Mostrar las sugerencias debajo del widget, o cerrar si no hay"""
+        if not suggestions:
+            if self.attach_to is not None:
+                self.dismiss()
             return
-        try:
-            self.canvas.before.clear()
-            with self.canvas.before:
-                if self.state == "down":
-                    Color(*COLORS["danger"])
-                else:
-                    Color(*COLORS["input_background"])
+        for index, row in enumerate(self.rows):
+            text = suggestions[index] if index < len(suggestions) else ""
+            row.text = text
+            row.height = self.row_height if text else 0
+            row.opacity = 1 if text else 0
+            row.disabled = not text
+        # dismiss() closes on the next frame, keep it open if it is pending
+        Clock.unschedule(self._real_dismiss)
+        if self.attach_to is None:
+            self.open(widget)
 
-                self.bg_rect = RoundedRectangle(
-                    pos=(self.x, self.y), size=(self.width, self.height), radius=[dp(8)]
-                )
+    def update_text_width(self, row, width):
+        row.text_size = (width - dp(30), None)
 
-                Color(*COLORS["border"])
-                self.border_rect = Line(width=1)
-                self.border_rect.rounded_rectangle = (
-                    self.x,
-                    self.y,
-                    self.width,
-                    self.height,
-                    dp(8),
-                )
-        except Exception:
-            pass
 
+class ModernToggleButton(ThemedButtonBehavior, ToggleButton):
+    """Modern styled toggle button, filled with the theme colour when selected"""
 
-class ModernIncomeToggle(ModernToggleButton):
-    """Toggle button specifically for income (green theme)"""
-
-    def update_colors(self):
-        """Update colors with income-specific theme"""
-        if self.state == "down":
-            # Selected income - green/success color
-            self.background_color = COLORS["success"]
-        else:
-            # Unselected state - dark background
-            self.background_color = COLORS["input_background"]
-
-    def update_canvas(self, *args):
-        """Update canvas with income colors"""
-        self.update_colors()
-        if self.width <= 1 or self.height <= 1:
-            return
-        try:
-            self.canvas.before.clear()
-            with self.canvas.before:
-                if self.state == "down":
-                    Color(*COLORS["success"])
-                else:
-                    Color(*COLORS["input_background"])
-
-                self.bg_rect = RoundedRectangle(
-                    pos=(self.x, self.y), size=(self.width, self.height), radius=[dp(8)]
-                )
-
-                Color(*COLORS["border"])
-                self.border_rect = Line(width=1)
-                self.border_rect.rounded_rectangle = (
-                    self.x,
-                    self.y,
-                    self.width,
-                    self.height,
-                    dp(8),
-                )
-        except Exception:
-            pass
+    border_color = ColorProperty(COLORS["border"])
 
 
 class DatePickerWidget(BoxLayout):
@@ -414,6 +362,8 @@ class DatePickerWidget(BoxLayout):
         )
         self.date_button.bind(on_press=self.open_date_picker)
         self.add_widget(self.date_button)
+        # El popup se construye la primera vez que se abre
+        self.date_popup = None
 
         # Button para fecha de hoy
         today_button = ModernButton(text="HOY", size_hint_x=0.25, button_type="primary")
@@ -425,8 +375,21 @@ class DatePickerWidget(BoxLayout):
         self.selected_date = datetime.now().date()
         self.date_button.text = self.selected_date.strftime("%d/%m/%Y")
 
+    @frame_monitor.trace("open_date_picker")
     def open_date_picker(self, instance):
         """Abrir el selector de fecha"""
+        if self.date_popup is None:
+            self.build_date_popup()
+        else:
+            # Reutilizar el popup mostrando el mes de la fecha seleccionada
+            self.month_spinner.text = MONTHS_ES[self.selected_date.month - 1]
+            self.year_spinner.text = str(self.selected_date.year)
+            self.update_calendar_grid()
+        self.date_before_open = self.selected_date
+        self.date_popup.open()
+
+    def build_date_popup(self):
+        """Construir el popup del selector de fecha"""
         content = BoxLayout(orientation="vertical", spacing=dp(10), padding=dp(10))
 
         # Título
@@ -451,22 +414,10 @@ class DatePickerWidget(BoxLayout):
         nav_layout.add_widget(prev_month_btn)
 
         # Spinner para mes
-        months = [
-            "Enero",
-            "Febrero",
-            "Marzo",
-            "Abril",
-            "Mayo",
-            "Junio",
-            "Julio",
-            "Agosto",
-            "Septiembre",
-            "Octubre",
-            "Noviembre",
-            "Diciembre",
-        ]
         self.month_spinner = ModernSpinner(
-            text=months[self.selected_date.month - 1], values=months, size_hint_x=0.4
+            text=MONTHS_ES[self.selected_date.month - 1],
+            values=MONTHS_ES,
+            size_hint_x=0.4,
         )
         nav_layout.add_widget(self.month_spinner)
 
@@ -498,6 +449,18 @@ class DatePickerWidget(BoxLayout):
             )
             self.calendar_grid.add_widget(label)
 
+        # Celdas de los días, se crean una sola vez y se reutilizan
+        self.day_cells = []
+        for _ in range(6 * 7):
+            day_button = ModernButton(
+                text="", size_hint_y=None, height=dp(40), button_type="secondary"
+            )
+            day_button.day_date = None
+            day_button.bind(on_press=self.on_day_press)
+            self.calendar_grid.add_widget(day_button)
+            self.day_cells.append(day_button)
+        self.selected_cell = None
+
         self.update_calendar_grid()
         content.add_widget(self.calendar_grid)
 
@@ -525,31 +488,14 @@ class DatePickerWidget(BoxLayout):
         )
 
         # Bind events
-        cancel_button.bind(on_press=self.date_popup.dismiss)
+        cancel_button.bind(on_press=self.cancel_date)
         ok_button.bind(on_press=self.confirm_date)
         self.month_spinner.bind(text=self.on_month_year_change)
         self.year_spinner.bind(text=self.on_month_year_change)
 
-        self.date_popup.open()
-
     def change_month(self, delta):
         """Cambiar mes"""
-        # Convertir nombres de meses en español
-        months_es = [
-            "Enero",
-            "Febrero",
-            "Marzo",
-            "Abril",
-            "Mayo",
-            "Junio",
-            "Julio",
-            "Agosto",
-            "Septiembre",
-            "Octubre",
-            "Noviembre",
-            "Diciembre",
-        ]
-        current_month = months_es.index(self.month_spinner.text) + 1
+        current_month = MONTHS_ES.index(self.month_spinner.text) + 1
         current_year = int(self.year_spinner.text)
 
         new_month = current_month + delta
@@ -562,71 +508,65 @@ class DatePickerWidget(BoxLayout):
             new_month = 12
             new_year -= 1
 
-        self.month_spinner.text = months_es[new_month - 1]
+        # El grid se actualiza con el evento de cambio de texto de los spinners
+        self.month_spinner.text = MONTHS_ES[new_month - 1]
         self.year_spinner.text = str(new_year)
-        self.update_calendar_grid()
 
     def on_month_year_change(self, instance, value):
         """Actualizar calendario cuando cambia mes o año"""
         self.update_calendar_grid()
 
+    @frame_monitor.trace("update_calendar_grid")
     def update_calendar_grid(self):
-        """Actualizar el grid del calendario"""
-        # Limpiar días anteriores
-        children_to_remove = [
-            child for child in self.calendar_grid.children if isinstance(child, Button)
-        ]
-        for child in children_to_remove:
-            self.calendar_grid.remove_widget(child)
-
+        """Actualizar el grid del calendario reutilizando las celdas"""
         # Obtener mes y año seleccionados
-        months_es = [
-            "Enero",
-            "Febrero",
-            "Marzo",
-            "Abril",
-            "Mayo",
-            "Junio",
-            "Julio",
-            "Agosto",
-            "Septiembre",
-            "Octubre",
-            "Noviembre",
-            "Diciembre",
-        ]
-        month = months_es.index(self.month_spinner.text) + 1
+        month = MONTHS_ES.index(self.month_spinner.text) + 1
         year = int(self.year_spinner.text)
 
-        # Obtener primer día del mes y número de días
-        first_day = date(year, month, 1)
-        last_day = date(year, month, calendar.monthrange(year, month)[1])
-
         # Calcular días a mostrar
-        start_weekday = first_day.weekday()  # 0 = Monday
-
-        # Agregar días vacíos al inicio
-        for _ in range(start_weekday):
-            empty_label = Label(text="")
-            self.calendar_grid.add_widget(empty_label)
-
-        # Agregar días del mes
-        for day in range(1, last_day.day + 1):
-            day_date = date(year, month, day)
-
-            # Determinar el tipo de botón según si está seleccionado
-            button_type = "primary" if day_date == self.selected_date else "secondary"
-
-            day_button = ModernButton(
-                text=str(day), size_hint_y=None, height=dp(40), button_type=button_type
-            )
+        start_weekday = date(year, month, 1).weekday()  # 0 = Monday
+        days_in_month = calendar.monthrange(year, month)[1]
+
+        self.selected_cell = None
+        for index, cell in enumerate(self.day_cells):
+            day = index - start_weekday + 1
+            if 1 <= day <= days_in_month:
+                cell.day_date = date(year, month, day)
+                cell.text = str(day)
+                cell.disabled = False
+                cell.opacity = 1
+                if cell.day_date == self.selected_date:
+                    self.selected_cell = cell
+                    cell.set_button_type("primary")
+                else:
+                    cell.set_button_type("secondary")
+            else:
+                # Celdas vacías al inicio y al final del mes
+                cell.day_date = None
+                cell.text = ""
+                cell.disabled = True
+                cell.opacity = 0
 
-            day_button.bind(on_press=lambda x, d=day_date: self.select_date(d))
-            self.calendar_grid.add_widget(day_button)
+    def on_day_press(self, cell):
+        if cell.day_date is not None:
+            self.select_date(cell.day_date, cell)
 
-    def select_date(self, selected_date):
+    def select_date(self, selected_date, cell=None):
         """Seleccionar una fecha específica"""
         self.selected_date = selected_date
-        self.update_calendar_grid()
+        if cell is None:
+            self.update_calendar_grid()
+            return
+        # Solo cambian la celda seleccionada antes y la nueva
+        if self.selected_cell is not None:
+            self.selected_cell.set_button_type("secondary")
+        cell.set_button_type("primary")
+        self.selected_cell = cell
+
+    def cancel_date(self, instance):
+        """Descartar la fecha elegida en el popup"""
+        self.selected_date = self.date_before_open
+        self.date_popup.dismiss()
 
     def confirm_date(self, instance):
         """Confirmar la fecha seleccionada"""
@@ -638,23 +578,337 @@ class DatePickerWidget(BoxLayout):
         return self.selected_date
 
 
+class RecordRow(RecycleDataViewBehavior, BoxLayout):
+    """Fila del historial, la RecycleView reutiliza un número fijo de ellas"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.orientation = "horizontal"
+        self.padding = [dp(10), dp(4)]
+        self.spacing = dp(10)
+
+        with self.canvas.before:
+            Color(*COLORS["border"])
+            self.divider = Rectangle(pos=self.pos, size=(self.width, 1))
+        self.bind(pos=self.update_divider, size=self.update_divider)
+
+        text_layout = BoxLayout(orientation="vertical")
+        self.description_label = ModernLabel(
+            label_type="primary", halign="left", valign="middle", shorten=True
+        )
+        self.description_label.bind(size=self.description_label.setter("text_size"))
+        self.detail_label = ModernLabel(
+            label_type="secondary", halign="left", valign="middle", shorten=True
+        )
+        self.detail_label.bind(size=self.detail_label.setter("text_size"))
+        text_layout.add_widget(self.description_label)
+        text_layout.add_widget(self.detail_label)
+        self.add_widget(text_layout)
+
+        self.amount_label = ModernLabel(
+            label_type="primary", size_hint_x=None, width=dp(100), halign="right"
+        )
+        self.amount_label.bind(size=self.amount_label.setter("text_size"))
+        self.add_widget(self.amount_label)
+
+    def update_divider(self, *args):
+        self.divider.pos = self.pos
+        self.divider.size = (self.width, 1)
+
+    def refresh_view_attrs(self, rv, index, data):
+        """Cargar los datos de un registro en la fila reutilizada"""
+        self.description_label.text = data["description"]
+        self.detail_label.text = data["detail"]
+        self.amount_label.text = data["amount"]
+        return super().refresh_view_attrs(rv, index, data)
+
+
+class HistoryView(BoxLayout):
+    """Historial de registros, cargado por páginas desde la copia local"""
+
+    def __init__(self, ledger=None, categories=None, page_size=100, **kwargs):
+        super().__init__(**kwargs)
+        self.ledger = ledger
+        self.page_size = page_size
+        self.category_names = {}
+        self.set_categories(categories or DEFAULT_CATEGORIES)
+        self.exhausted = False
+        self.orientation = "vertical"
+        self.spacing = dp(10)
+        self.padding = dp(20)
+        with self.canvas.before:
+            Color(*COLORS["background"])
+            self.rect = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self.update_bg, size=self.update_bg)
+
+        header = BoxLayout(
+            orientation="horizontal", size_hint_y=None, height=dp(50), spacing=dp(10)
+        )
+        header.add_widget(ModernLabel(text="Historial", label_type="subtitle"))
+        summary_button = ModernButton(
+            text="RESUMEN", size_hint_x=None, width=dp(110), button_type="primary"
+        )
+        summary_button.bind(on_press=self.show_analytics)
+        header.add_widget(summary_button)
+        back_button = ModernButton(
+            text="VOLVER", size_hint_x=None, width=dp(110), button_type="secondary"
+        )
+        back_button.bind(on_press=self.go_back)
+        header.add_widget(back_button)
+        self.add_widget(header)
+
+        self.empty_label = ModernLabel(
+            text="", size_hint_y=None, height=dp(25), label_type="secondary"
+        )
+        self.add_widget(self.empty_label)
+
+        card = ModernCard(orientation="vertical")
+        self.records_view = RecycleView(viewclass=RecordRow)
+        layout = RecycleBoxLayout(
+            orientation="vertical",
+            default_size=(None, dp(56)),
+            default_size_hint=(1, None),
+            size_hint_y=None,
+        )
+        layout.bind(minimum_height=layout.setter("height"))
+        layout.bind(height=self.keep_scroll_position)
+        self.records_view.add_widget(layout)
+        self.records_layout = layout
+        # Distancia al principio de la lista antes de agregar una página
+        self.scroll_anchor = None
+        # Cargar la siguiente página al acercarse al final
+        self.records_view.bind(scroll_y=self.on_scroll)
+        card.add_widget(self.records_view)
+        self.add_widget(card)
+
+    def update_bg(self, *args):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+
+    def set_categories(self, categories):
+        """Actualizar los nombres de categoría mostrados"""
+        if categories:
+            self.category_names = {cat["id"]: cat["name"] for cat in categories}
+
+    def reload(self):
+        """Volver a cargar el historial desde el principio"""
+        self.records_view.data = []
+        self.exhausted = False
+        self.load_next_page()
+        self.records_view.scroll_y = 1
+
+    @frame_monitor.trace("load_next_page")
+    def load_next_page(self):
+        """Agregar la siguiente página de registros"""
+        if self.ledger is None or self.exhausted:
+            return
+        records = self.ledger.recent(
+            limit=self.page_size, offset=len(self.records_view.data)
+        )
+        if len(records) < self.page_size:
+            self.exhausted = True
+        if records and self.records_view.data:
+            self.scroll_anchor = (1 - self.records_view.scroll_y) * max(
+                self.records_layout.height - self.records_view.height, 0
+            )
+        self.records_view.data.extend(self.to_row(record) for record in records)
+        self.empty_label.text = (
+            "" if self.records_view.data else "Todavía no hay registros"
+        )
+
+    def to_row(self, record):
+        category = self.category_names.get(record.get("category"), "")
+        return {
+            "description": record.get("description", ""),
+            "detail": f"{record.get('date', '')}  {category}".strip(),
+            "amount": f"${float(record.get('amount', 0)):.2f}",
+        }
+
+    def keep_scroll_position(self, instance, height):
+        """Mantener la posición visible al crecer la lista"""
+        if self.scroll_anchor is None:
+            return
+        scrollable = height - self.records_view.height
+        if scrollable > 0:
+            self.records_view.scroll_y = 1 - self.scroll_anchor / scrollable
+        self.scroll_anchor = None
+
+    def on_scroll(self, instance, scroll_y):
+        if scroll_y <= 0.1:
+            self.load_next_page()
+
+    def show_analytics(self, instance):
+        App.get_running_app().show_analytics()
+
+    def go_back(self, instance):
+        App.get_running_app().show_form()
+
+
+class AnalyticsView(BoxLayout):
+    """Resumen de gastos calculado en segundo plano sobre la copia local"""
+
+    def __init__(self, ledger=None, categories=None, **kwargs):
+        super().__init__(**kwargs)
+        self.ledger = ledger
+        self.category_names = {}
+        self.set_categories(categories or DEFAULT_CATEGORIES)
+        self.loading = False
+        # Columnas cargadas de la copia local, cada refresco lee solo lo nuevo
+        self.spending = None
+        self.orientation = "vertical"
+        self.spacing = dp(10)
+        self.padding = dp(20)
+        with self.canvas.before:
+            Color(*COLORS["background"])
+            self.rect = Rectangle(pos=self.pos, size=self.size)
+        self.bind(pos=self.update_bg, size=self.update_bg)
+
+        header = BoxLayout(orientation="horizontal", size_hint_y=None, height=dp(50))
+        header.add_widget(ModernLabel(text="Resumen", label_type="subtitle"))
+        back_button = ModernButton(
+            text="VOLVER", size_hint_x=None, width=dp(110), button_type="secondary"
+        )
+        back_button.bind(on_press=self.go_back)
+        header.add_widget(back_button)
+        self.add_widget(header)
+
+        self.status_label = ModernLabel(
+            text="", size_hint_y=None, height=dp(25), label_type="secondary"
+        )
+        self.add_widget(self.status_label)
+
+        # Las filas del historial sirven también para el resumen
+        card = ModernCard(orientation="vertical")
+        self.summary_view = RecycleView(viewclass=RecordRow)
+        layout = RecycleBoxLayout(
+            orientation="vertical",
+            default_size=(None, dp(56)),
+            default_size_hint=(1, None),
+            size_hint_y=None,
+        )
+        layout.bind(minimum_height=layout.setter("height"))
+        self.summary_view.add_widget(layout)
+        card.add_widget(self.summary_view)
+        self.add_widget(card)
+
+    def update_bg(self, *args):
+        self.rect.pos = self.pos
+        self.rect.size = self.size
+
+    def set_categories(self, categories):
+        """Actualizar los nombres de categoría mostrados"""
+        if categories:
+            self.category_names = {cat["id"]: cat["name"] for cat in categories}
+
+    def refresh(self):
+        """Recalcular el resumen sin bloquear la UI"""
+        if not ANALYTICS_AVAILABLE:
+            self.status_label.text = "Instala numpy para ver el resumen"
+            return
+        if self.ledger is None or self.loading:
+            return
+        self.loading = True
+        self.status_label.text = "Calculando..."
+        thread = threading.Thread(target=self._compute, daemon=True)
+        thread.start()
+
+    def _compute(self):
+        try:
+            if self.spending is None:
+                self.spending = SpendingAnalytics.from_ledger(self.ledger)
+            else:
+                self.spending.refresh(self.ledger)
+            summary = self.spending.summary()
+        except Exception as e:
+            print(f"Error computing summary: {e}")
+            summary = None
+        Clock.schedule_once(lambda dt: self.show_summary(summary))
+
+    @frame_monitor.trace("show_summary")
+    def show_summary(self, summary):
+        """Mostrar el resumen calculado (se ejecuta en el hilo principal)"""
+        self.loading = False
+        if summary is None:
+            self.status_label.text = "No se pudo calcular el resumen"
+            return
+        if not summary["records"]:
+            self.status_label.text = "Todavía no hay registros"
+            self.summary_view.data = []
+            return
+        self.status_label.text = f"{summary['records']} registros"
+        days = summary["window_days"]
+        rows = [
+            self.row("Este mes", "", summary["this_month"]),
+            self.row(f"Últimos {days} días", "", summary["last_days"]),
+            self.row("Total", "Todos los registros", summary["total"]),
+        ]
+        for category, amount in list(summary["last_days_categories"].items())[:5]:
+            name = self.category_names.get(category, "Sin categoría")
+            rows.append(self.row(name, f"Últimos {days} días", amount))
+        for month in summary["months"]:
+            year, number = month["month"].split("-")
+            if month["change"] is None:
+                detail = "Sin datos del año anterior"
+            else:
+                detail = f"{month['change']:+.1%} vs {int(year) - 1}"
+            rows.append(
+                self.row(f"{MONTHS_ES[int(number) - 1]} {year}", detail, month["total"])
+            )
+        self.summary_view.data = rows
+
+    @staticmethod
+    def row(description, detail, amount):
+        return {
+            "description": description,
+            "detail": detail,
+            "amount": f"${amount:.2f}",
+        }
+
+    def go_back(self, instance):
+        App.get_running_app().show_history()
+
+
 class ExpenseForm(BoxLayout):
-    def __init__(self, categories=None, client=None, **kwargs):
+    def __init__(
+        self,
+        categories=None,
+        client=None,
+        submitter=None,
+        ledger=None,
+        suggester=None,
+        description_index=None,
+        **kwargs,
+    ):
         super().__init__(**kwargs)
         # Use the client passed from the app
         self.client = client or ExpensyClient()
+        # Copia local de los registros, opcional
+        self.ledger = ledger
+        # Sugiere la categoría a partir de la descripción, opcional
+        self.suggester = suggester
+        # Se vuelve True cuando el usuario elige la categoría a mano
+        self.category_chosen = False
+        self.setting_category = False
+        # Autocompletado de la descripción, opcional
+        self.description_index = description_index
+        self.description_suggestions = None
+        self.picking_description = False
+        # Los registros se envían en segundo plano para no bloquear la UI
+        self.submitter = submitter or RecordSubmitter(
+            self.client, dispatch=run_on_main_thread
+        )
         
         # Store categories in memory
-        self.categories = categories or [
-            {"id": 1, "name": "Hogar"},
-            {"id": 2, "name": "Comidas y bebidas"},
-            {"id": 3, "name": "Salud y cuidado personal"},
-            {"id": 4, "name": "Supermercado"},
-        ]
+        self.categories = categories or DEFAULT_CATEGORIES
         # Extract category names for the spinner
         self.category_names = [cat["name"] for cat in self.categories]
         # Create a mapping from name to id for later use
         self.category_name_to_id = {cat["name"]: cat["id"] for cat in self.categories}
+        self.category_id_to_name = {cat["id"]: cat["name"] for cat in self.categories}
+        # Popup de mensajes, se construye con el primer aviso
+        self.message_popup = None
+        # Acción del botón de confirmación del popup, si el aviso la tiene
+        self.popup_confirm = None
         self.orientation = "vertical"
         self.spacing = dp(2)
         self.padding = dp(20)
@@ -698,85 +952,36 @@ class ExpenseForm(BoxLayout):
         form_layout.bind(minimum_height=form_layout.setter("height"))
 
         # Campo Descripción
-        desc_section = BoxLayout(
-            orientation="vertical", spacing=dp(8), size_hint_y=None, height=dp(80)
-        )
-        # Contenedor para alineación izquierda
-        desc_label_container = BoxLayout(
-            orientation="horizontal", size_hint_y=None, height=dp(25)
-        )
-        desc_label = ModernLabel(text="Descripción", label_type="primary")
-        desc_label.size_hint_x = None
-        desc_label.width = dp(100)
-        desc_label.size_hint_y = None
-        desc_label.height = dp(25)
-
-        desc_label_container.add_widget(desc_label)
-        desc_label_container.add_widget(BoxLayout())  # Spacer para empujar
-        desc_section.add_widget(desc_label_container)
-
         self.description_input = ModernTextInput(
             multiline=False,
             size_hint_y=None,
             height=dp(50),
             hint_text="Describe el gasto o ingreso",
         )
-        desc_section.add_widget(self.description_input)
-        form_layout.add_widget(desc_section)
-
-        # Tipo: Gasto o Ingreso
-        type_section = BoxLayout(
-            orientation="vertical", spacing=dp(8), size_hint_y=None, height=dp(80)
-        )
-        # Contenedor para alineación izquierda
-        type_label_container = BoxLayout(
-            orientation="horizontal", size_hint_y=None, height=dp(25)
+        self.description_input.bind(text=self.suggest_category)
+        self.description_input.bind(text=self.suggest_descriptions)
+        form_layout.add_widget(
+            self.build_section("Descripción", dp(100), self.description_input)
         )
-        type_label = ModernLabel(text="Tipo", label_type="primary")
-        type_label.size_hint_x = None
-        type_label.width = dp(60)
-        type_label.size_hint_y = None
-        type_label.height = dp(25)
-
-        type_label_container.add_widget(type_label)
-        type_label_container.add_widget(BoxLayout())  # Spacer
-        type_section.add_widget(type_label_container)
 
+        # Tipo: Gasto o Ingreso
         type_layout = BoxLayout(
             orientation="horizontal", spacing=dp(10), size_hint_y=None, height=dp(50)
         )
 
         # Crear botones de toggle personalizados
-        self.expense_toggle = ModernExpenseToggle(
-            text="Gasto", group="type", state="down", size_hint_x=0.5
+        self.expense_toggle = ModernToggleButton(
+            text="Gasto", group="type", state="down", theme="danger", size_hint_x=0.5
         )
-        self.income_toggle = ModernIncomeToggle(
-            text="Ingreso", group="type", size_hint_x=0.5
+        self.income_toggle = ModernToggleButton(
+            text="Ingreso", group="type", theme="success", size_hint_x=0.5
         )
 
         type_layout.add_widget(self.expense_toggle)
         type_layout.add_widget(self.income_toggle)
-        type_section.add_widget(type_layout)
-        form_layout.add_widget(type_section)
+        form_layout.add_widget(self.build_section("Tipo", dp(60), type_layout))
 
         # Campo Monto
-        amount_section = BoxLayout(
-            orientation="vertical", spacing=dp(8), size_hint_y=None, height=dp(80)
-        )
-        # Contenedor para alineación izquierda
-        amount_label_container = BoxLayout(
-            orientation="horizontal", size_hint_y=None, height=dp(25)
-        )
-        amount_label = ModernLabel(text="Monto", label_type="primary")
-        amount_label.size_hint_x = None
-        amount_label.width = dp(70)
-        amount_label.size_hint_y = None
-        amount_label.height = dp(25)
-
-        amount_label_container.add_widget(amount_label)
-        amount_label_container.add_widget(BoxLayout())  # Spacer
-        amount_section.add_widget(amount_label_container)
-
         self.amount_input = ModernTextInput(
             multiline=False,
             size_hint_y=None,
@@ -784,57 +989,18 @@ class ExpenseForm(BoxLayout):
             input_filter="float",
             hint_text="0.00",
         )
-        amount_section.add_widget(self.amount_input)
-        form_layout.add_widget(amount_section)
-
-        # Campo Fecha
-        date_section = BoxLayout(
-            orientation="vertical", spacing=dp(8), size_hint_y=None, height=dp(80)
-        )
-        # Contenedor para alineación izquierda
-        date_label_container = BoxLayout(
-            orientation="horizontal", size_hint_y=None, height=dp(25)
-        )
-        date_label = ModernLabel(text="Fecha", label_type="primary")
-        date_label.size_hint_x = None
-        date_label.width = dp(70)
-        date_label.size_hint_y = None
-        date_label.height = dp(25)
+        form_layout.add_widget(self.build_section("Monto", dp(70), self.amount_input))
 
-        date_label_container.add_widget(date_label)
-        date_label_container.add_widget(BoxLayout())  # Spacer
-        date_section.add_widget(date_label_container)
+        # Fecha y categoría quedan debajo de lo visible al abrir la app, se
+        # construyen después del primer frame o al usarlas por primera vez.
+        # Un schedule_once desde build() corre en el primer Clock.tick, antes
+        # de dibujar, por eso se espera al primer on_flip de la ventana
+        self.form_layout = form_layout
+        self.date_picker = None
+        self.category_spinner = None
+        from kivy.core.window import Window
 
-        self.date_picker = DatePickerWidget(size_hint_y=None, height=dp(50))
-        date_section.add_widget(self.date_picker)
-        form_layout.add_widget(date_section)
-
-        # Campo Categoría
-        category_section = BoxLayout(
-            orientation="vertical", spacing=dp(8), size_hint_y=None, height=dp(80)
-        )
-        # Contenedor para alineación izquierda
-        category_label_container = BoxLayout(
-            orientation="horizontal", size_hint_y=None, height=dp(25)
-        )
-        category_label = ModernLabel(text="Categoría", label_type="primary")
-        category_label.size_hint_x = None
-        category_label.width = dp(90)
-        category_label.size_hint_y = None
-        category_label.height = dp(25)
-
-        category_label_container.add_widget(category_label)
-        category_label_container.add_widget(BoxLayout())  # Spacer
-        category_section.add_widget(category_label_container)
-
-        self.category_spinner = ModernSpinner(
-            text=self.category_names[0],
-            values=self.category_names,
-            size_hint_y=None,
-            height=dp(50),
-        )
-        category_section.add_widget(self.category_spinner)
-        form_layout.add_widget(category_section)
+        Window.bind(on_flip=self.on_first_flip)
 
         scroll.add_widget(form_layout)
         form_card.add_widget(scroll)
@@ -846,25 +1012,161 @@ class ExpenseForm(BoxLayout):
         )
 
         save_button = ModernButton(
-            text="GUARDAR", size_hint_x=0.6, button_type="success"
+            text="GUARDAR", size_hint_x=0.4, button_type="success"
         )
         save_button.bind(on_press=self.save_record)
 
         clear_button = ModernButton(
-            text="LIMPIAR", size_hint_x=0.4, button_type="secondary"
+            text="LIMPIAR", size_hint_x=0.3, button_type="secondary"
         )
         clear_button.bind(on_press=self.clear_form)
 
+        history_button = ModernButton(
+            text="HISTORIAL", size_hint_x=0.3, button_type="primary"
+        )
+        history_button.bind(on_press=self.show_history)
+
         button_layout.add_widget(save_button)
         button_layout.add_widget(clear_button)
+        button_layout.add_widget(history_button)
         self.add_widget(button_layout)
 
+        # Estado de los envíos en curso
+        self.status_label = ModernLabel(
+            text="",
+            size_hint_y=None,
+            height=dp(25),
+            label_type="secondary",
+            halign="center",
+        )
+        self.add_widget(self.status_label)
+
     def update_bg(self, *args):
         """Update background rectangle"""
         self.rect.pos = self.pos
         self.rect.size = self.size
 
+    def build_section(self, label_text, label_width, field):
+        """Sección del formulario con una etiqueta alineada a la izquierda"""
+        section = BoxLayout(
+            orientation="vertical", spacing=dp(8), size_hint_y=None, height=dp(80)
+        )
+        # Contenedor para alineación izquierda
+        label_container = BoxLayout(
+            orientation="horizontal", size_hint_y=None, height=dp(25)
+        )
+        label = ModernLabel(text=label_text, label_type="primary")
+        label.size_hint_x = None
+        label.width = label_width
+        label.size_hint_y = None
+        label.height = dp(25)
+
+        label_container.add_widget(label)
+        label_container.add_widget(BoxLayout())  # Spacer para empujar
+        section.add_widget(label_container)
+        section.add_widget(field)
+        return section
+
+    def on_first_flip(self, window):
+        """Programar las secciones diferidas una vez dibujado el primer frame"""
+        window.unbind(on_flip=self.on_first_flip)
+        Clock.schedule_once(self.build_deferred_sections)
+
+    @frame_monitor.trace("build_deferred_sections")
+    def build_deferred_sections(self, *args):
+        """Construir las secciones de fecha y categoría si aún no existen"""
+        if self.date_picker is not None:
+            return
+        # Aparece en el informe de arranque solo si se construyen antes del
+        # primer frame
+        startup.mark("deferred_sections")
+
+        # Campo Fecha
+        self.date_picker = DatePickerWidget(size_hint_y=None, height=dp(50))
+        self.form_layout.add_widget(
+            self.build_section("Fecha", dp(70), self.date_picker)
+        )
+
+        # Campo Categoría
+        self.category_spinner = ModernSpinner(
+            text=self.category_names[0],
+            values=self.category_names,
+            size_hint_y=None,
+            height=dp(50),
+        )
+        self.category_spinner.bind(text=self.on_category_text)
+        self.form_layout.add_widget(
+            self.build_section("Categoría", dp(90), self.category_spinner)
+        )
+
+    def set_categories(self, categories):
+        """Actualizar las categorías sin reconstruir el formulario"""
+        if not categories:
+            return
+        self.categories = categories
+        self.category_names = [cat["name"] for cat in self.categories]
+        self.category_name_to_id = {cat["name"]: cat["id"] for cat in self.categories}
+        self.category_id_to_name = {cat["id"]: cat["name"] for cat in self.categories}
+        if self.category_spinner is None:
+            # El spinner se construirá con las categorías nuevas
+            return
+        # Mantener la selección actual si sigue existiendo
+        current = self.category_spinner.text
+        self.category_spinner.values = self.category_names
+        if current not in self.category_name_to_id:
+            self.set_category(self.category_names[0])
+
+    @frame_monitor.trace("suggest_category")
+    def suggest_category(self, instance, text):
+        """Elegir la categoría probable mientras se escribe la descripción"""
+        if self.suggester is None or self.category_chosen:
+            return
+        if self.category_spinner is None:
+            self.build_deferred_sections()
+        name = self.category_id_to_name.get(self.suggester.suggest(text))
+        if name is not None and name != self.category_spinner.text:
+            self.set_category(name)
+
+    @frame_monitor.trace("suggest_descriptions")
+    def suggest_descriptions(self, instance, text):
+        """Mostrar descripciones usadas antes que empiezan con el texto"""
+        if self.description_index is None or self.picking_description:
+            return
+        suggestions = []
+        if instance.focus:
+            suggestions = [
+                description
+                for description in self.description_index.suggest(text)
+                if description != text.strip()
+            ]
+        if self.description_suggestions is None:
+            if not suggestions:
+                return
+            self.description_suggestions = SuggestionDropDown(
+                rows=self.description_index.limit
+            )
+            self.description_suggestions.bind(on_select=self.pick_description)
+        self.description_suggestions.show(instance, suggestions)
+
+    def pick_description(self, instance, description):
+        """Completar la descripción con la sugerencia elegida"""
+        self.picking_description = True
+        self.description_input.text = description
+        self.picking_description = False
+
+    def set_category(self, name):
+        """Cambiar la categoría sin contarla como elegida por el usuario"""
+        self.setting_category = True
+        self.category_spinner.text = name
+        self.setting_category = False
+
+    def on_category_text(self, instance, text):
+        if not self.setting_category:
+            self.category_chosen = True
+
+    @frame_monitor.trace("save_record")
     def save_record(self, instance):
+        self.build_deferred_sections()
         # Validate required fields
         if not self.description_input.text.strip():
             self.show_popup("Error", "La descripción es obligatoria")
@@ -899,28 +1201,76 @@ class ExpenseForm(BoxLayout):
             "category": category_id
         }
 
-        try:
-            # Create record using ExpensyClient
-            self.client.create_record(record_data)
-            
-            # Show success message
-            message = f"""Registro guardado exitosamente:
-
-Descripción: {record_data['description']}
-Monto: ${record_data['amount']:.2f}
-Fecha: {selected_date.strftime("%d/%m/%Y")}
-Categoría: {selected_category_name}"""
-
-            self.show_popup("Éxito", message)
-            self.clear_form(None)
-            
-        except Exception as e:
-            # Show error message
-            error_message = f"Error al guardar el registro: {str(e)}"
-            self.show_popup("Error", error_message)
+        # Avisar antes de crear un registro igual a uno existente, el usuario
+        # puede guardarlo igual (p. ej. dos cafés el mismo día)
+        if self.client.duplicates is not None:
+            matched_date = self.client.duplicates.find(record_data)
+            if matched_date is not None:
+                self.show_popup(
+                    "Registro duplicado",
+                    f"'{record_data['description']}' ya se registró el "
+                    f"{matched_date}. ¿Guardarlo de todos modos?",
+                    on_confirm=lambda: self.submit_record(
+                        record_data, allow_duplicate=True
+                    ),
+                )
+                return
+
+        self.submit_record(record_data)
+
+    def submit_record(self, record_data, allow_duplicate=False):
+        """Poner el registro en la cola de envío y limpiar el formulario"""
+        # Store the record in the outbox, it is sent in the background
+        self.submitter.submit(
+            record_data,
+            on_success=self.on_record_saved,
+            on_error=self.on_record_failed,
+            allow_duplicate=allow_duplicate,
+        )
+        self.update_status(f"En cola: {record_data['description']}")
+        self.clear_form(None)
+
+    def on_record_saved(self, record_data, result):
+        """Registro creado en el servidor (se ejecuta en el hilo principal)"""
+        if self.ledger is not None and isinstance(result, dict):
+            self.ledger.upsert([result])
+        record_id = result.get("id") if isinstance(result, dict) else None
+        if self.description_index is not None:
+            self.description_index.add(
+                record_data["description"], record_data["date"], record_id
+            )
+        if self.suggester is not None:
+            self.suggester.learn(
+                record_data["description"], record_data["category"], record_id
+            )
+        self.update_status(
+            f"Guardado: {record_data['description']} "
+            f"${record_data['amount']:.2f}"
+        )
+
+    def on_record_failed(self, record_data, error):
+        """Error al crear el registro (se ejecuta en el hilo principal)"""
+        self.update_status("")
+        error_message = (
+            f"Error al guardar el registro '{record_data['description']}': {str(error)}"
+        )
+        self.show_popup("Error", error_message)
+
+    def update_status(self, message):
+        """Mostrar el estado de los envíos pendientes"""
+        pending = self.submitter.pending
+        if pending:
+            message = f"{message} ({pending} pendiente(s))"
+        self.status_label.text = message
 
+    def show_history(self, instance):
+        """Mostrar el historial de registros"""
+        App.get_running_app().show_history()
+
+    @frame_monitor.trace("clear_form")
     def clear_form(self, instance):
         """Limpiar todos los campos del formulario"""
+        self.build_deferred_sections()
         self.description_input.text = ""
         self.amount_input.text = ""
         self.expense_toggle.state = "down"
@@ -930,11 +1280,23 @@ Categoría: {selected_category_name}"""
         self.date_picker.set_today(None)
 
         # Restablecer categoría
-        self.category_spinner.text = self.category_names[0]
-
-    def show_popup(self, title, message):
-        """Mostrar popup con mensaje moderno"""
-        content = ModernCard(orientation="vertical")
+        self.set_category(self.category_names[0])
+        self.category_chosen = False
+
+    def show_popup(self, title, message, on_confirm=None):
+        """
+        Mostrar popup con mensaje moderno
+        Con on_confirm se agrega el botón GUARDAR IGUAL, que lo ejecuta.
+        """
+        if self.message_popup is None:
+            self.build_message_popup()
+
+        self.popup_confirm = on_confirm
+        if on_confirm is None:
+            if self.confirm_button.parent is not None:
+                self.message_buttons.remove_widget(self.confirm_button)
+        elif self.confirm_button.parent is None:
+            self.message_buttons.add_widget(self.confirm_button, index=1)
 
         # Icono según el tipo
         if "éxito" in title.lower():
@@ -944,31 +1306,48 @@ Categoría: {selected_category_name}"""
         else:
             icon = "[i]"
 
-        title_with_icon = ModernLabel(
-            text=f"{icon} {title}",
+        self.message_title.text = f"{icon} {title}"
+        self.message_label.text = message
+        # Si ya está abierto solo se actualiza el mensaje
+        if self.message_popup.parent is None:
+            self.message_popup.open()
+
+    def build_message_popup(self):
+        """Construir el popup de mensajes, se reutiliza en cada aviso"""
+        content = ModernCard(orientation="vertical")
+
+        self.message_title = ModernLabel(
+            text="",
             label_type="subtitle",
             size_hint_y=None,
             height=dp(40),
             halign="center",
         )
-        title_with_icon.text_size = (dp(300), None)
-        content.add_widget(title_with_icon)
+        self.message_title.text_size = (dp(300), None)
+        content.add_widget(self.message_title)
 
-        label = ModernLabel(
-            text=message,
+        self.message_label = ModernLabel(
+            text="",
             text_size=(dp(300), None),
             halign="center",
             valign="middle",
             label_type="primary",
         )
-        content.add_widget(label)
+        content.add_widget(self.message_label)
 
-        close_button = ModernButton(
-            text="CERRAR", size_hint_y=None, height=dp(50), button_type="primary"
+        self.message_buttons = BoxLayout(
+            orientation="horizontal", spacing=dp(10), size_hint_y=None, height=dp(50)
+        )
+        close_button = ModernButton(text="CERRAR", button_type="primary")
+        self.message_buttons.add_widget(close_button)
+        # Solo se muestra en los avisos que piden confirmación
+        self.confirm_button = ModernButton(
+            text="GUARDAR IGUAL", button_type="secondary"
         )
-        content.add_widget(close_button)
+        self.confirm_button.bind(on_press=self.on_popup_confirm)
+        content.add_widget(self.message_buttons)
 
-        popup = Popup(
+        self.message_popup = Popup(
             title="",
             content=content,
             size_hint=(0.85, 0.6),
@@ -976,41 +1355,185 @@ Categoría: {selected_category_name}"""
             separator_height=0,
         )
 
-        close_button.bind(on_press=popup.dismiss)
-        popup.open()
+        close_button.bind(on_press=self.message_popup.dismiss)
+
+    def on_popup_confirm(self, instance):
+        """Cerrar el popup y ejecutar la acción confirmada"""
+        callback, self.popup_confirm = self.popup_confirm, None
+        self.message_popup.dismiss()
+        if callback is not None:
+            callback()
 
 
 class ExpensyApp(App):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
-        self.categories = []
         self.categories_loaded = False
+        self.form = None
+        self.history = None
+        self.analytics = None
+        self.screens = None
         # Initialize ExpensyClient once for the entire app
-        self.client = ExpensyClient()
+        trace_log = os.environ.get("EXPENSY_TRACE_LOG")
+        self.duplicates = DuplicateIndex()
+        self.client = ExpensyClient(
+            hooks=[JsonLinesSpanExporter(trace_log)] if trace_log else None,
+            duplicates=self.duplicates,
+        )
+        self.submitter = RecordSubmitter(self.client, dispatch=run_on_main_thread)
+        self.ledger = RecordLedger()
+        self.suggester = CategorySuggester()
+        self.description_index = DescriptionIndex()
+        # Start from the last known categories, if any were cached
+        self.categories = self.client.get_cached_categories() or list(
+            DEFAULT_CATEGORIES
+        )
+        startup.mark("app_init")
 
     def load_categories(self):
-        """Load categories from the REST API"""
+        """Load categories from the REST API without blocking the UI"""
+        thread = threading.Thread(target=self._fetch_categories, daemon=True)
+        thread.start()
+
+    def _fetch_categories(self):
+        """Fetch categories in a worker thread and hand them to the main thread"""
         try:
-            self.categories = self.client.get_categories()
-            self.categories_loaded = True
-            print(f"Loaded {len(self.categories)} categories from API")
+            categories = self.client.get_categories()
         except Exception as e:
             print(f"Error loading categories: {e}")
-            # Fallback to default categories
-            self.categories = [
-                {"id": 1, "name": "Hogar"},
-                {"id": 2, "name": "Comidas y bebidas"},
-                {"id": 3, "name": "Salud y cuidado personal"},
-                {"id": 4, "name": "Supermercado"},
-            ]
-            self.categories_loaded = True
+            # Keep the default categories already shown in the form
+            return
+        # Categories may come from the cache, open the connection anyway
+        self.client.warm_up()
+        Clock.schedule_once(lambda dt: self.on_categories_loaded(categories))
+
+    def sync_ledger(self):
+        """Update the local copy of the records without blocking the UI"""
+        thread = threading.Thread(target=self._sync_ledger, daemon=True)
+        thread.start()
+
+    def _sync_ledger(self):
+        # Load the duplicate hashes here, so the first save does not wait
+        self.duplicates.load()
+        # Suggest categories and descriptions from the local copy before the
+        # sync finishes
+        previous_cursor = self.ledger.cursor
+        self.suggester.learn_many(self.ledger.iter_records())
+        self.description_index.add_many(self.ledger.iter_records())
+        self.description_index.warm()
+        # An empty index is filled with every record already in the ledger
+        cursor = previous_cursor if len(self.duplicates) else None
+        try:
+            count = self.ledger.sync(self.client)
+        except Exception as e:
+            # The next start resumes from the last stored page
+            print(f"Error syncing records: {e}")
+            return
+        self.duplicates.add_many(self.ledger.iter_records(modified_after=cursor))
+        self.suggester.learn_many(self.ledger.iter_records(modified_after=cursor))
+        # Records already added above are skipped by id, only new ones count
+        if count and self.description_index.add_many(
+            self.ledger.iter_records(modified_after=previous_cursor)
+        ):
+            self.description_index.warm()
+        print(f"Synced {count} records ({self.ledger.count()} in ledger)")
+        Clock.schedule_once(lambda dt: self.on_ledger_synced())
+
+    def on_ledger_synced(self):
+        """Refresh the history if it is on screen (runs on the main thread)"""
+        if self.history is not None and self.screens.current == "history":
+            self.history.reload()
+        if self.analytics is not None and self.screens.current == "analytics":
+            self.analytics.refresh()
+
+    def show_history(self):
+        """Switch to the records history, built on first use"""
+        if self.history is None:
+            self.history = HistoryView(ledger=self.ledger, categories=self.categories)
+            screen = Screen(name="history")
+            screen.add_widget(self.history)
+            self.screens.add_widget(screen)
+        self.history.reload()
+        self.screens.current = "history"
+
+    def show_analytics(self):
+        """Switch to the spending summary, built on first use"""
+        if self.analytics is None:
+            self.analytics = AnalyticsView(
+                ledger=self.ledger, categories=self.categories
+            )
+            screen = Screen(name="analytics")
+            screen.add_widget(self.analytics)
+            self.screens.add_widget(screen)
+        self.analytics.refresh()
+        self.screens.current = "analytics"
+
+    def show_form(self):
+        """Go back to the expense form"""
+        self.screens.current = "form"
+
+    def on_categories_loaded(self, categories):
+        """Apply the categories fetched from the API (runs on the main thread)"""
+        self.categories = categories
+        self.categories_loaded = True
+        print(
+            f"Loaded {len(self.categories)} categories "
+            f"(cache: {self.client.category_cache.stats()})"
+        )
+        if self.form is not None:
+            self.form.set_categories(self.categories)
+        if self.history is not None:
+            self.history.set_categories(self.categories)
+        if self.analytics is not None:
+            self.analytics.set_categories(self.categories)
 
     def build(self):
         self.title = "Expensy - Gestor de Gastos e Ingresos"
-        # Load categories before building the UI
+        # Build the UI right away and refresh categories when they arrive
+        self.form = ExpenseForm(
+            categories=self.categories,
+            client=self.client,
+            submitter=self.submitter,
+            ledger=self.ledger,
+            suggester=self.suggester,
+            description_index=self.description_index,
+        )
+        startup.mark("form_built")
+        self.screens = ScreenManager(transition=NoTransition())
+        form_screen = Screen(name="form")
+        form_screen.add_widget(self.form)
+        self.screens.add_widget(form_screen)
         self.load_categories()
-        return ExpenseForm(categories=self.categories, client=self.client)
+        self.sync_ledger()
+        startup.mark("build")
+        return self.screens
+
+    def on_start(self):
+        frame_monitor.start()
+        if startup.enabled:
+            from kivy.core.window import Window
+
+            Window.bind(on_flip=self.on_first_frame)
+
+    def on_first_frame(self, window):
+        """Write the startup report once the first frame is on screen"""
+        window.unbind(on_flip=self.on_first_frame)
+        startup.mark("first_frame")
+        startup.write_report()
+        if startup.exit_after_report:
+            self.stop()
+
+    def on_stop(self):
+        """Stop the outbox flusher, unsent records are replayed on next start"""
+        frame_monitor.stop()
+        if os.environ.get("EXPENSY_TRACE_LOG"):
+            print(f"Client metrics: {self.client.metrics.snapshot()}")
+        self.submitter.shutdown(wait=True, timeout=2)
+        self.client.close()
+        self.ledger.close()
+        self.duplicates.close()
 
 
 if __name__ == "__main__":
     ExpensyApp().run()
+    sys.exit(startup.exit_code())
@@ -0,0 +1,149 @@
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import List, Dict, Optional
+import json_codec
+from category_cache import DEFAULT_CACHE_DIR
+
+
+class RecordOutbox:
+    """Persistent write-ahead queue of records waiting to be sent"""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Initialize the outbox
+        Args:
+            path: SQLite database file, ":memory:" keeps it in memory
+        """
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "outbox.sqlite3")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            if self.path != ":memory:":
+                self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS outbox (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    idempotency_key TEXT NOT NULL UNIQUE,
+                    payload TEXT NOT NULL,
+                    allow_duplicate INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    created_at REAL NOT NULL
+                )
+                """
+            )
+            columns = {
+                row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")
+            }
+            # Outboxes written before the column existed
+            if "allow_duplicate" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE outbox "
+                    "ADD COLUMN allow_duplicate INTEGER NOT NULL DEFAULT 0"
+                )
+
+    def enqueue(
+        self, record_data: Dict[str, any], allow_duplicate: bool = False
+    ) -> Dict[str, any]:
+        """
+        Write a record to the outbox before it is sent
+        Args:
+            record_data: Record data, same structure as in create_record
+            allow_duplicate: Send it even if the duplicate index has a match
+        Returns:
+            Outbox entry with the keys "id", "idempotency_key", "record",
+            "allow_duplicate" and "attempts"
+        """
+        key = str(uuid.uuid4())
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox "
+                "(idempotency_key, payload, allow_duplicate, created_at) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    key,
+                    json_codec.dumps(record_data).decode("utf-8"),
+                    int(allow_duplicate),
+                    time.time(),
+                ),
+            )
+        return {
+            "id": cursor.lastrowid,
+            "idempotency_key": key,
+            "record": record_data,
+            "allow_duplicate": allow_duplicate,
+            "attempts": 0,
+        }
+
+    def peek(self) -> Optional[Dict[str, any]]:
+        """Return the oldest pending entry, or None if there is nothing to send"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, idempotency_key, payload, allow_duplicate, attempts "
+                "FROM outbox WHERE status = 'pending' ORDER BY id LIMIT 1"
+            ).fetchone()
+        if row is None:
+            return None
+        return self._row_to_entry(row)
+
+    def mark_sent(self, entry_id: int):
+        """Remove an entry once the server has accepted it"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM outbox WHERE id = ?", (entry_id,))
+
+    def record_attempt(self, entry_id: int, error: str):
+        """Register a failed attempt that will be retried"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, last_error = ? "
+                "WHERE id = ?",
+                (error, entry_id),
+            )
+
+    def mark_failed(self, entry_id: int, error: str):
+        """Stop retrying an entry the server will never accept"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = 'failed', attempts = attempts + 1, "
+                "last_error = ? WHERE id = ?",
+                (error, entry_id),
+            )
+
+    def pending_count(self) -> int:
+        """Number of entries still waiting to be sent"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status = 'pending'"
+            ).fetchone()[0]
+
+    def failed(self) -> List[Dict[str, any]]:
+        """Entries that were rejected by the server"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, idempotency_key, payload, allow_duplicate, attempts "
+                "FROM outbox WHERE status = 'failed' ORDER BY id"
+            ).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def close(self):
+        """Close the database connection"""
+        with self._lock:
+            self._conn.close()
+
+    @staticmethod
+    def _row_to_entry(row) -> Dict[str, any]:
+        entry_id, key, payload, allow_duplicate, attempts = row
+        return {
+            "id": entry_id,
+            "idempotency_key": key,
+            "record": json_codec.loads(payload),
+            "allow_duplicate": bool(allow_duplicate),
+            "attempts": attempts,
+        }
@@ -0,0 +1,175 @@
+import threading
+import requests
+from typing import Callable, Dict, Optional
+from outbox import RecordOutbox
+
+# HTTP errors that are worth retrying, any other 4xx is a permanent rejection
+RETRYABLE_STATUS = {408, 425, 429}
+
+
+def is_retryable(error: Exception) -> bool:
+    """Whether a create_record error is temporary, e.g. the server is down"""
+    if isinstance(error, ValueError):
+        return False
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        status = error.response.status_code
+        return status >= 500 or status in RETRYABLE_STATUS
+    return isinstance(error, requests.RequestException)
+
+
+class RecordSubmitter:
+    """Sends records to the service from a background worker
+
+    Every record is written to a persistent outbox first, so it survives
+    crashes and offline periods. A flusher thread drains the outbox in order,
+    backing off exponentially while the server is unreachable.
+    """
+
+    def __init__(
+        self,
+        client,
+        outbox: Optional[RecordOutbox] = None,
+        dispatch: Optional[Callable[[Callable[[], None]], None]] = None,
+        on_success: Optional[Callable[[Dict[str, any], Dict[str, any]], None]] = None,
+        on_error: Optional[Callable[[Dict[str, any], Exception], None]] = None,
+        base_backoff: float = 1.0,
+        max_backoff: float = 300.0,
+    ):
+        """
+        Initialize the submitter and start draining the outbox
+        Args:
+            client: ExpensyClient used to create the records
+            outbox: Persistent queue, a default one in the user's home
+            directory is used if not given
+            dispatch: Function used to run the callbacks, e.g. on the UI
+            thread. By default they run in the worker thread.
+            on_success: Default callback for records without their own, such
+            as the ones left over from a previous run
+            on_error: Default callback for records the server rejected
+            base_backoff: Seconds to wait after the first failed attempt
+            max_backoff: Upper limit for the wait between attempts
+        """
+        self.client = client
+        self.outbox = outbox or RecordOutbox()
+        self._dispatch = dispatch or (lambda callback: callback())
+        self.on_success = on_success
+        self.on_error = on_error
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        # Guards _callbacks, the flusher may see an entry as soon as the
+        # outbox commits it
+        self._lock = threading.Lock()
+        self._callbacks = {}
+        self._failures = 0
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="expensy-outbox", daemon=True
+        )
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Number of records not yet accepted by the server"""
+        return self.outbox.pending_count()
+
+    def submit(
+        self,
+        record_data: Dict[str, any],
+        on_success: Optional[Callable[[Dict[str, any], Dict[str, any]], None]] = None,
+        on_error: Optional[Callable[[Dict[str, any], Exception], None]] = None,
+        allow_duplicate: bool = False,
+    ) -> int:
+        """
+        Store a record in the outbox and queue it to be sent
+        Args:
+            record_data: Record data, same structure as in create_record
+            on_success: Called with (record_data, created_record)
+            on_error: Called with (record_data, exception) if the server
+            rejects the record. Connection errors are retried instead.
+            allow_duplicate: Send it even if the duplicate index has a match
+        Returns:
+            Id of the outbox entry
+        """
+        with self._lock:
+            entry = self.outbox.enqueue(record_data, allow_duplicate)
+            self._callbacks[entry["id"]] = (on_success, on_error)
+        self._wake.set()
+        return entry["id"]
+
+    def flush_now(self):
+        """Retry immediately instead of waiting for the current backoff"""
+        self._failures = 0
+        self._wake.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.clear()
+            try:
+                entry = self.outbox.peek()
+                if entry is None:
+                    self._wake.wait()
+                    continue
+                sent = self._send(entry)
+            except Exception as e:
+                # Keep the flusher alive, e.g. if the outbox database is locked
+                print(f"Error flushing outbox: {e}")
+                self._failures += 1
+                sent = False
+            if not sent:
+                # Capped exponent, 2 ** 1024 does not fit in a float
+                exponent = min(max(self._failures - 1, 0), 20)
+                delay = min(self.base_backoff * 2**exponent, self.max_backoff)
+                self._wake.wait(delay)
+
+    def _send(self, entry: Dict[str, any]) -> bool:
+        """Send one entry, returns False if it has to be retried later"""
+        record_data = entry["record"]
+        # Waits for a submit that is still registering the callbacks
+        with self._lock:
+            on_success, on_error = self._callbacks.get(entry["id"], (None, None))
+        try:
+            result = self.client.create_record(
+                record_data,
+                idempotency_key=entry["idempotency_key"],
+                allow_duplicate=entry["allow_duplicate"],
+            )
+        except Exception as e:
+            if self._is_retryable(e):
+                self._failures += 1
+                self.outbox.record_attempt(entry["id"], str(e))
+                return False
+            self._failures = 0
+            self.outbox.mark_failed(entry["id"], str(e))
+            self._forget(entry["id"])
+            self._notify(on_error or self.on_error, record_data, e)
+            return True
+        self._failures = 0
+        self.outbox.mark_sent(entry["id"])
+        self._forget(entry["id"])
+        self._notify(on_success or self.on_success, record_data, result)
+        return True
+
+    def _forget(self, entry_id: int):
+        with self._lock:
+            self._callbacks.pop(entry_id, None)
+
+    @staticmethod
+    def _is_retryable(error: Exception) -> bool:
+        return is_retryable(error)
+
+    def _notify(self, callback, record_data, value):
+        if callback:
+            self._dispatch(lambda: callback(record_data, value))
+
+    def shutdown(self, wait: bool = True, timeout: Optional[float] = None):
+        """
+        Stop the flusher. Records not sent yet stay in the outbox and are
+        replayed the next time a submitter is created.
+        """
+        self._stop.set()
+        self._wake.set()
+        if wait:
+            self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.outbox.close()
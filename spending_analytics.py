@@ -0,0 +1,253 @@
+"""Spending summaries computed over columnar arrays of the records
+
+The records are loaded once into three NumPy arrays (date as days since
+1970-01-01, amount in cents, category id) and every total is a vectorized
+group-by with np.bincount, without Python loops over the records. Arrays
+loaded from a RecordLedger are kept between refreshes, which only read the
+records added or modified since the previous one.
+NumPy is optional for the app: ANALYTICS_AVAILABLE is False without it.
+"""
+
+from itertools import chain
+from typing import Dict, Iterable, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+ANALYTICS_AVAILABLE = np is not None
+
+# Category id of the records without one
+NO_CATEGORY = -1
+
+
+class SpendingAnalytics:
+    """Monthly, category, rolling and year-over-year totals of the records"""
+
+    def __init__(self, days, cents, categories, ids=None):
+        """
+        Initialize from the columns, use from_rows or from_ledger instead
+        Args:
+            days: int32 array, days since 1970-01-01
+            cents: int64 array, amounts in cents
+            categories: int32 array, category ids (NO_CATEGORY if none)
+            ids: int64 array, record ids, needed by refresh
+        """
+        if np is None:
+            raise RuntimeError("numpy is required for the spending analytics")
+        self.days = days
+        self.cents = cents
+        self.categories = categories
+        self.ids = ids
+        # Sync cursor of the ledger at the last refresh
+        self._cursor = None
+
+    @classmethod
+    def from_rows(
+        cls, rows: Iterable[Tuple[str, float, Optional[int]]]
+    ) -> "SpendingAnalytics":
+        """
+        Build the columns from (date, amount, category) rows
+        Rows without a valid YYYY-MM-DD date are left out.
+        """
+        if np is None:
+            raise RuntimeError("numpy is required for the spending analytics")
+        rows = list(rows)
+        if not rows:
+            return cls(
+                np.zeros(0, np.int32), np.zeros(0, np.int64), np.zeros(0, np.int32)
+            )
+        dates, amounts, categories = zip(*rows)
+        # Empty or malformed dates become NaT
+        try:
+            days = np.array(dates, dtype="datetime64[D]")
+        except ValueError:
+            days = np.array([cls._parse_date(d) for d in dates], dtype="datetime64[D]")
+        valid = ~np.isnat(days)
+        cents = np.rint(np.asarray(amounts, dtype=np.float64) * 100).astype(np.int64)
+        categories = np.array(
+            [NO_CATEGORY if c is None else c for c in categories], dtype=np.int32
+        )
+        return cls(
+            days[valid].astype(np.int64).astype(np.int32),
+            cents[valid],
+            categories[valid],
+        )
+
+    @classmethod
+    def from_ledger(cls, ledger) -> "SpendingAnalytics":
+        """Load every record of a RecordLedger, keep it to refresh it later"""
+        if np is None:
+            raise RuntimeError("numpy is required for the spending analytics")
+        analytics = cls(
+            np.zeros(0, np.int32),
+            np.zeros(0, np.int64),
+            np.zeros(0, np.int32),
+            np.zeros(0, np.int64),
+        )
+        analytics.refresh(ledger)
+        return analytics
+
+    def refresh(self, ledger) -> int:
+        """
+        Read the records of the ledger added or modified since the last
+        refresh, the rows of the others are kept
+        Returns:
+            Number of records read
+        Raises:
+            ValueError: If the instance was not built with from_ledger
+        """
+        if self.ids is None:
+            raise ValueError("Only analytics built with from_ledger can refresh")
+        # Taken before the rows, a sync in between is read again next time
+        cursor = ledger.cursor
+        last_id = int(self.ids.max()) if len(self.ids) else None
+        rows = ledger.columns(last_id, self._cursor)
+        self._cursor = cursor
+        if not rows:
+            return 0
+        # float64 turns the NULL days and categories into NaN
+        columns = np.fromiter(
+            chain.from_iterable(rows), np.float64, count=4 * len(rows)
+        ).reshape(-1, 4)
+        ids = columns[:, 0].astype(np.int64)
+        valid = ~np.isnan(columns[:, 1])
+        categories = np.nan_to_num(columns[:, 3], nan=NO_CATEGORY)
+        if last_id is not None and ids.min() <= last_id:
+            # Modified records, drop their old values
+            keep = ~np.isin(self.ids, ids)
+            self.ids = self.ids[keep]
+            self.days = self.days[keep]
+            self.cents = self.cents[keep]
+            self.categories = self.categories[keep]
+        self.ids = np.concatenate((self.ids, ids[valid]))
+        self.days = np.concatenate((self.days, columns[valid, 1].astype(np.int32)))
+        self.cents = np.concatenate((self.cents, columns[valid, 2].astype(np.int64)))
+        self.categories = np.concatenate(
+            (self.categories, categories[valid].astype(np.int32))
+        )
+        return len(rows)
+
+    def __len__(self) -> int:
+        return len(self.days)
+
+    def total(self, start: Optional[str] = None, end: Optional[str] = None) -> float:
+        """Sum of the amounts between two dates, both included"""
+        return int(self.cents[self._mask(start, end)].sum()) / 100
+
+    def monthly_totals(
+        self, start: Optional[str] = None, end: Optional[str] = None
+    ) -> Dict[str, float]:
+        """Total per month, as {"YYYY-MM": amount}, for months with records"""
+        months, totals = self._monthly(self._mask(start, end))
+        present = totals != 0
+        labels = months[present].astype("datetime64[M]").astype(str)
+        return dict(zip(labels.tolist(), (totals[present] / 100).tolist()))
+
+    def category_totals(
+        self, start: Optional[str] = None, end: Optional[str] = None
+    ) -> Dict[int, float]:
+        """Total per category id, largest first"""
+        mask = self._mask(start, end)
+        categories = self.categories[mask]
+        if not len(categories):
+            return {}
+        offset = int(categories.min())
+        totals = np.bincount(
+            categories - offset, weights=self.cents[mask].astype(np.float64)
+        )
+        ids = np.flatnonzero(totals)
+        order = ids[np.argsort(totals[ids])[::-1]]
+        return {int(i) + offset: float(totals[i]) / 100 for i in order}
+
+    def rolling_totals(self, window_days: int = 30):
+        """
+        Sum over the last window_days for every day
+        Returns:
+            (datetime64[D] array with every day from the first to the last
+            record, float64 array with the total of the window ending there)
+        """
+        if not len(self.days):
+            return np.zeros(0, "datetime64[D]"), np.zeros(0)
+        first = int(self.days.min())
+        daily = np.bincount(self.days - first, weights=self.cents.astype(np.float64))
+        running = np.cumsum(daily)
+        rolling = running.copy()
+        rolling[window_days:] -= running[:-window_days]
+        days = np.arange(first, first + len(daily)).astype("datetime64[D]")
+        return days, rolling / 100
+
+    def year_over_year(self) -> Dict[str, Dict[str, Optional[float]]]:
+        """
+        Every month with records compared with the same month a year before
+        Returns:
+            {"YYYY-MM": {"total": amount, "previous": amount or None,
+            "change": fraction or None}}
+        """
+        months, totals = self._monthly(self._mask(None, None))
+        previous = np.full(len(totals), np.nan)
+        previous[12:] = totals[:-12]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = (totals - previous) / previous
+        result = {}
+        present = np.flatnonzero(totals)
+        labels = months[present].astype("datetime64[M]").astype(str).tolist()
+        for label, i in zip(labels, present):
+            has_previous = not np.isnan(previous[i]) and previous[i] != 0
+            result[label] = {
+                "total": float(totals[i]) / 100,
+                "previous": float(previous[i]) / 100 if has_previous else None,
+                "change": float(change[i]) if has_previous else None,
+            }
+        return result
+
+    def summary(self, today: Optional[str] = None, window_days: int = 30) -> Dict:
+        """
+        Everything the summary screen shows, with plain Python values
+        Args:
+            today: Reference date in YYYY-MM-DD format, today if not given
+            window_days: Days of the rolling total
+        """
+        today = np.datetime64(today or "today", "D")
+        window_start = str(today - window_days + 1)
+        month_start = str(today.astype("datetime64[M]").astype("datetime64[D]"))
+        year_over_year = self.year_over_year()
+        months = sorted(year_over_year)[-12:]
+        return {
+            "records": len(self),
+            "total": self.total(),
+            "last_days": self.total(window_start, str(today)),
+            "window_days": window_days,
+            "this_month": self.total(month_start, str(today)),
+            "categories": self.category_totals(),
+            "last_days_categories": self.category_totals(window_start, str(today)),
+            "months": [dict(year_over_year[m], month=m) for m in reversed(months)],
+        }
+
+    def _mask(self, start: Optional[str], end: Optional[str]):
+        mask = np.ones(len(self.days), dtype=bool)
+        if start:
+            mask &= self.days >= np.datetime64(start, "D").astype(np.int64)
+        if end:
+            mask &= self.days <= np.datetime64(end, "D").astype(np.int64)
+        return mask
+
+    def _monthly(self, mask):
+        """Dense totals in cents from the first to the last month with records"""
+        days = self.days[mask]
+        if not len(days):
+            return np.zeros(0, np.int64), np.zeros(0)
+        months = days.astype("datetime64[D]").astype("datetime64[M]").astype(np.int64)
+        first = int(months.min())
+        totals = np.bincount(
+            months - first, weights=self.cents[mask].astype(np.float64)
+        )
+        return np.arange(first, first + len(totals)), totals
+
+    @staticmethod
+    def _parse_date(value) -> str:
+        try:
+            return str(np.datetime64(value, "D"))
+        except (ValueError, TypeError):
+            return "NaT"
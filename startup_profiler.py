@@ -0,0 +1,97 @@
+import json
+import os
+import time
+from typing import List, Dict, Optional
+
+
+class StartupProfiler:
+    """Records how long each startup phase takes, up to the first frame
+
+    It is disabled unless EXPENSY_STARTUP_REPORT is set, in which case a JSON
+    report is written to that path once the first frame has been drawn.
+    EXPENSY_STARTUP_BUDGET sets the maximum seconds to the first frame and
+    EXPENSY_STARTUP_EXIT=1 closes the app after the report, for headless runs.
+    """
+
+    def __init__(
+        self,
+        report_path: Optional[str] = None,
+        budget: Optional[float] = None,
+        exit_after_report: bool = False,
+    ):
+        """
+        Initialize the profiler, the start time is the moment it is created
+        Args:
+            report_path: JSON file for the report, None disables profiling
+            budget: Maximum seconds from start to first frame
+            exit_after_report: Stop the app once the report is written
+        """
+        self.report_path = report_path
+        self.budget = budget
+        self.exit_after_report = exit_after_report
+        self.enabled = report_path is not None
+        self.start = time.monotonic()
+        self.marks = []
+        self.over_budget = False
+
+    @classmethod
+    def from_environ(cls) -> "StartupProfiler":
+        """Create the profiler configured by the environment variables"""
+        budget = os.environ.get("EXPENSY_STARTUP_BUDGET")
+        return cls(
+            report_path=os.environ.get("EXPENSY_STARTUP_REPORT"),
+            budget=float(budget) if budget else None,
+            exit_after_report=os.environ.get("EXPENSY_STARTUP_EXIT") == "1",
+        )
+
+    def mark(self, phase: str):
+        """Record the end of a startup phase"""
+        if self.enabled:
+            self.marks.append((phase, time.monotonic()))
+
+    def phases(self) -> List[Dict[str, any]]:
+        """Duration of every phase, and time since start when it ended"""
+        phases = []
+        previous = self.start
+        for phase, timestamp in self.marks:
+            phases.append(
+                {
+                    "phase": phase,
+                    "duration": timestamp - previous,
+                    "elapsed": timestamp - self.start,
+                }
+            )
+            previous = timestamp
+        return phases
+
+    def report(self) -> Dict[str, any]:
+        """Build the report with the phases and the budget check"""
+        total = self.marks[-1][1] - self.start if self.marks else 0.0
+        self.over_budget = self.budget is not None and total > self.budget
+        return {
+            "total": total,
+            "budget": self.budget,
+            "over_budget": self.over_budget,
+            "phases": self.phases(),
+        }
+
+    def write_report(self) -> Optional[Dict[str, any]]:
+        """Write the JSON report, returns it or None if profiling is off"""
+        if not self.enabled:
+            return None
+        report = self.report()
+        try:
+            with open(self.report_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        except OSError as e:
+            print(f"Error writing startup report: {e}")
+        if self.over_budget:
+            print(
+                f"Startup took {report['total']:.3f}s, "
+                f"over the {self.budget:.3f}s budget"
+            )
+        return report
+
+    def exit_code(self) -> int:
+        """Non-zero when the startup budget was exceeded"""
+        return 1 if self.over_budget else 0
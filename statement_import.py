@@ -0,0 +1,682 @@
+"""Import bank statements (CSV or OFX) as Expensy records
+
+Usage:
+    python statement_import.py statement.csv [--base-url URL] [--batch-size 200]
+        [--date-format %d/%m/%Y] [--decimal ,] [--category 1]
+
+The file is read as a stream and sent in batches, so memory use does not
+depend on its size. After every batch the last committed line is stored, and
+running the same command again after a crash resumes from there.
+"""
+
+import argparse
+import csv
+import hashlib
+import io
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from itertools import islice
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import json_codec
+from category_cache import DEFAULT_CACHE_DIR
+from category_suggester import CategorySuggester
+from expensy_client import ExpensyClient
+from ledger import RecordLedger
+from duplicate_index import DuplicateIndex, DuplicateRecordError
+from record_submitter import is_retryable
+
+# Value of the "source" field for imported records
+IMPORT_SOURCE = "importación"
+
+# Accepted header names for each record field, compared in lower case
+CSV_COLUMNS = {
+    "description": (
+        "description",
+        "descripción",
+        "descripcion",
+        "concepto",
+        "detalle",
+    ),
+    "amount": ("amount", "monto", "importe", "valor"),
+    "date": ("date", "fecha", "fecha operación", "fecha valor"),
+    "category": ("category", "categoría", "categoria"),
+}
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%m-%Y", "%Y/%m/%d")
+
+# Bytes hashed to recognise a file in checkpoints written before whole
+# files were hashed
+FINGERPRINT_BYTES = 64 * 1024
+# Bytes read at a time while hashing a file
+HASH_CHUNK_BYTES = 1024 * 1024
+
+OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+
+
+def parse_amount(text: str, decimal: Optional[str] = None) -> float:
+    """
+    Parse an amount such as "-1.234,56" or "1,234.56"
+    Args:
+        text: Amount as written in the statement
+        decimal: Decimal separator, "." or ",". If not given, it is the last
+        separator, unless that one is repeated or followed by exactly three
+        digits, as in "1.234" or "1.234.567", which makes it the thousands one.
+    Raises:
+        ValueError: If the text is not a number
+    """
+    text = text.strip().replace(" ", "").replace("$", "")
+    if decimal is None:
+        position = max(text.rfind("."), text.rfind(","))
+        decimal = "."
+        if position >= 0:
+            last = text[position]
+            other = "," if last == "." else "."
+            decimal = last
+            if other not in text and (
+                text.count(last) > 1 or len(text) - position - 1 == 3
+            ):
+                decimal = other
+    thousands = "." if decimal == "," else ","
+    return float(text.replace(thousands, "").replace(decimal, "."))
+
+
+def parse_date(text: str, date_format: Optional[str] = None) -> str:
+    """
+    Convert a statement date to YYYY-MM-DD
+    Raises:
+        ValueError: If the date does not match any known format
+    """
+    text = text.strip()
+    for fmt in (date_format,) if date_format else DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).strftime("%Y-%m-%d")
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date '{text}'")
+
+
+def iter_csv_rows(
+    stream, columns: Optional[Dict[str, str]] = None
+) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """
+    Read CSV rows lazily, the delimiter is detected from the first lines
+    Args:
+        stream: Text stream opened with newline=""
+        columns: Header name for each record field, guessed if not given
+    Returns:
+        Iterator of (line number, {field: raw value})
+    """
+    sample = stream.read(4096)
+    stream.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.reader(stream, dialect)
+    header = [name.strip().lower() for name in next(reader, [])]
+    positions = {}
+    for field, names in CSV_COLUMNS.items():
+        wanted = (columns[field].lower(),) if columns and field in columns else names
+        for name in wanted:
+            if name in header:
+                positions[field] = header.index(name)
+                break
+    missing = {"description", "amount", "date"} - positions.keys()
+    if missing:
+        raise ValueError(f"Missing columns: {', '.join(sorted(missing))}")
+    for row in reader:
+        if not any(value.strip() for value in row):
+            continue
+        # line_num counts physical lines, also inside quoted multi-line fields
+        yield reader.line_num, {
+            field: row[position] if position < len(row) else ""
+            for field, position in positions.items()
+        }
+
+
+def iter_ofx_rows(stream) -> Iterator[Tuple[int, Dict[str, str]]]:
+    """
+    Read the <STMTTRN> transactions of an OFX file (SGML or XML) lazily
+    Transactions are numbered instead of taking their line number, since a
+    compact file has many of them on the same line.
+    Returns:
+        Iterator of (transaction number starting at 1, {field: raw value})
+    """
+    transaction = None
+    number = 0
+    for line in stream:
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if closing and transaction is not None:
+                    number += 1
+                    yield number, {
+                        "description": transaction.get("NAME")
+                        or transaction.get("MEMO", ""),
+                        "amount": transaction.get("TRNAMT", ""),
+                        # DTPOSTED is YYYYMMDD optionally followed by the time
+                        "date": transaction.get("DTPOSTED", "")[:8],
+                    }
+                transaction = None if closing else {}
+            elif transaction is not None and not closing:
+                transaction[tag] = value.strip()
+
+
+class StatementImporter:
+    """Streams statement files into ExpensyClient.create_records
+
+    Rows are mapped to the create_record payload and checked with
+    ExpensyClient.validate_record, so invalid rows are reported with their
+    line number instead of being sent. Progress is stored in a SQLite
+    database after every batch. A server outage stops the import after
+    storing which rows of the batch in flight were already handled, and a
+    resumed import only sends the rest. Files are recognised by the hash and
+    size of their whole content, and a file that grew since it was imported,
+    such as a statement downloaded again with new transactions, resumes after
+    the rows of the earlier checkpoint. Every row carries an idempotency key
+    made of the fingerprint of the first import and its line, so the server
+    discards the ones that were created before a crash and are sent again.
+    """
+
+    def __init__(
+        self,
+        client: ExpensyClient,
+        path: Optional[str] = None,
+        batch_size: int = 200,
+        max_workers: int = 4,
+        categories: Optional[List[Dict[str, any]]] = None,
+        default_category: int = 1,
+        source: str = IMPORT_SOURCE,
+        suggester: Optional[CategorySuggester] = None,
+    ):
+        """
+        Initialize the importer
+        Args:
+            client: ExpensyClient used to create the records
+            path: SQLite database with the checkpoints, ":memory:" keeps them
+            in memory
+            batch_size: Rows read, sent and committed at a time
+            max_workers: Single POSTs in flight when there is no bulk endpoint
+            categories: Categories used to resolve the names in a category
+            column, the cached ones by default
+            default_category: Category id when the row has none or it is
+            unknown
+            source: Value of the "source" field of the imported records
+            suggester: Assigns a category from the description to the rows
+            without one, before default_category is used
+        """
+        self.client = client
+        self.path = path or os.path.join(DEFAULT_CACHE_DIR, "imports.sqlite3")
+        if self.path != ":memory:":
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.default_category = default_category
+        self.source = source
+        self.suggester = suggester
+        self.category_ids = {}
+        for category in categories or client.get_cached_categories() or []:
+            for key in ("name", "alt_name"):
+                if category.get(key):
+                    self.category_ids[category[key].strip().lower()] = category["id"]
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS imports (
+                    fingerprint TEXT PRIMARY KEY,
+                    path TEXT NOT NULL,
+                    line INTEGER NOT NULL,
+                    imported INTEGER NOT NULL,
+                    rejected INTEGER NOT NULL,
+                    finished INTEGER NOT NULL DEFAULT 0,
+                    done TEXT NOT NULL DEFAULT '[]',
+                    updated_at REAL NOT NULL,
+                    size INTEGER,
+                    key_prefix TEXT
+                )
+                """
+            )
+            columns = {
+                row[1] for row in self._conn.execute("PRAGMA table_info(imports)")
+            }
+            # Checkpoints written before the columns existed
+            if "done" not in columns:
+                self._conn.execute(
+                    "ALTER TABLE imports ADD COLUMN done TEXT NOT NULL DEFAULT '[]'"
+                )
+            if "size" not in columns:
+                self._conn.execute("ALTER TABLE imports ADD COLUMN size INTEGER")
+            if "key_prefix" not in columns:
+                self._conn.execute("ALTER TABLE imports ADD COLUMN key_prefix TEXT")
+
+    def import_file(
+        self,
+        path: str,
+        file_format: Optional[str] = None,
+        encoding: str = "utf-8-sig",
+        columns: Optional[Dict[str, str]] = None,
+        date_format: Optional[str] = None,
+        decimal: Optional[str] = None,
+        on_progress: Optional[Callable[[Dict[str, any]], None]] = None,
+        on_rejected: Optional[Callable[[int, Dict[str, str], Exception], None]] = None,
+    ) -> Dict[str, any]:
+        """
+        Import a statement, resuming after the last committed line
+        Args:
+            path: CSV or OFX file
+            file_format: "csv" or "ofx", taken from the extension if not given
+            encoding: Text encoding of the file
+            columns: Header name for each record field (CSV only)
+            date_format: strptime format of the dates (CSV only), common
+            formats are tried if not given
+            decimal: Decimal separator of the amounts (CSV only), detected
+            per amount if not given
+            on_progress: Called after every batch with the progress dictionary
+            on_rejected: Called with (line, row, error) for rows that were not
+            imported, because they are invalid or the server rejected them.
+            In an OFX file the line is the transaction number.
+        Returns:
+            Progress dictionary:
+                {
+                    "line": last committed line, or transaction for OFX,
+                    "imported": records created,
+                    "rejected": rows not imported,
+                    "bytes_read": bytes read so far,
+                    "total_bytes": file size,
+                    "finished": True once the whole file was imported
+                }
+        Raises:
+            requests.RequestException: If the server cannot be reached, the
+            checkpoint keeps the last line committed and the rows of the next
+            batch that were handled
+        """
+        file_format = file_format or os.path.splitext(path)[1].lstrip(".").lower()
+        if file_format not in ("csv", "ofx", "qfx"):
+            raise ValueError(f"Unsupported statement format '{file_format}'")
+        fingerprint, previous = self._identify(path)
+        if file_format != "csv":
+            # Checkpoints of the 64 KiB fingerprint counted OFX lines
+            previous = [key for key in previous if "-" in key]
+        progress = self.checkpoint(fingerprint)
+        if progress is None and previous:
+            # The file grew since it was imported, continue after the rows of
+            # the latest checkpoint whose file is a prefix of this one
+            progress = self.checkpoint(previous[-1])
+            progress["finished"] = False
+        progress = progress or {
+            "line": 0,
+            "imported": 0,
+            "rejected": 0,
+            "finished": False,
+        }
+        # Keys stay those of the first import, so rows sent again match
+        key_prefix = progress.pop("key_prefix", None) or fingerprint
+        # Rows of the interrupted batch that were already imported or rejected
+        done = set(progress.pop("done", ()))
+        # A checkpoint in the middle of the file: the next batch may have been
+        # created before a crash that left no trace of it
+        resumed = progress["line"] > 0 or bool(done)
+        # Identical records seen so far, see DuplicateIndex.check
+        occurrences = {}
+        progress["total_bytes"] = os.path.getsize(path)
+        progress["bytes_read"] = 0
+        if progress["finished"]:
+            progress["bytes_read"] = progress["total_bytes"]
+            return progress
+        with open(path, "rb") as raw:
+            stream = io.TextIOWrapper(raw, encoding=encoding, newline="")
+            if file_format == "csv":
+                rows = iter_csv_rows(stream, columns)
+            else:
+                rows = iter_ofx_rows(stream)
+                date_format = "%Y%m%d"
+                decimal = "."
+            # Batches are cut as in the first run, so the batch that was in
+            # flight is sent again with the same records and keys
+            while True:
+                batch = list(islice(rows, self.batch_size))
+                if not batch:
+                    break
+                if batch[-1][0] <= progress["line"]:
+                    # Committed by a previous run, only counted as seen
+                    self._mark_seen(batch, date_format, decimal, occurrences)
+                    continue
+                # The last batch of a file that grew also has committed rows
+                done.update(line for line, _ in batch if line <= progress["line"])
+                try:
+                    self._import_batch(
+                        batch,
+                        date_format,
+                        decimal,
+                        progress,
+                        on_rejected,
+                        key_prefix,
+                        done,
+                        occurrences,
+                        resumed,
+                    )
+                except Exception:
+                    # Commit the rows that were handled before raising
+                    progress["bytes_read"] = raw.tell()
+                    self._save(fingerprint, key_prefix, path, progress, done)
+                    raise
+                resumed = False
+                done.clear()
+                progress["line"] = batch[-1][0]
+                # The buffered position, ahead of the parser by at most a chunk
+                progress["bytes_read"] = raw.tell()
+                self._save(fingerprint, key_prefix, path, progress)
+                if on_progress:
+                    on_progress(dict(progress))
+        progress["finished"] = True
+        progress["bytes_read"] = progress["total_bytes"]
+        self._save(fingerprint, key_prefix, path, progress)
+        if on_progress:
+            on_progress(dict(progress))
+        return progress
+
+    def to_record(
+        self,
+        row: Dict[str, str],
+        date_format: Optional[str] = None,
+        decimal: Optional[str] = None,
+        suggested_category: Optional[int] = None,
+    ) -> Dict[str, any]:
+        """
+        Map a statement row to the create_record payload
+        Debits and credits both become positive amounts, as in ExpenseForm.
+        Rows without a known category get suggested_category, if given, and
+        default_category otherwise.
+        Raises:
+            ValueError: If the row is not a valid record
+        """
+        category = (row.get("category") or "").strip()
+        if category.isdigit():
+            category_id = int(category)
+        else:
+            category_id = (
+                self.category_ids.get(category.lower())
+                or suggested_category
+                or self.default_category
+            )
+        record_data = {
+            "description": row["description"].strip()[:255],
+            "amount": abs(parse_amount(row["amount"], decimal)),
+            "source": self.source,
+            "date": parse_date(row["date"], date_format),
+            "category": category_id,
+        }
+        self.client.validate_record(record_data)
+        return record_data
+
+    def checkpoint(self, fingerprint: str) -> Optional[Dict[str, any]]:
+        """
+        Stored progress of a file, None if it was never imported
+        Same keys as the import_file result without the byte counts, plus
+        "done": lines after "line" that were handled before the import stopped,
+        and "key_prefix": prefix of the idempotency keys of the rows.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT line, imported, rejected, finished, done, key_prefix "
+                "FROM imports WHERE fingerprint = ?",
+                (fingerprint,),
+            ).fetchone()
+        if row is None:
+            return None
+        return {
+            "line": row[0],
+            "imported": row[1],
+            "rejected": row[2],
+            "finished": bool(row[3]),
+            "done": json_codec.loads(row[4]),
+            "key_prefix": row[5] or fingerprint,
+        }
+
+    def forget(self, path: str):
+        """
+        Drop the checkpoints of a file, and those of the files it grew from,
+        so it is imported again from the start
+        """
+        fingerprint, previous = self._identify(path)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "DELETE FROM imports WHERE fingerprint = ?",
+                [(key,) for key in (fingerprint, *previous)],
+            )
+
+    def close(self):
+        """Close the checkpoint database"""
+        with self._lock:
+            self._conn.close()
+
+    def _import_batch(
+        self,
+        batch,
+        date_format,
+        decimal,
+        progress,
+        on_rejected,
+        key_prefix,
+        done,
+        occurrences,
+        resumed,
+    ):
+        """
+        Send the rows of a batch that are not in done yet
+        Rows are added to done once imported or rejected. With resumed, a
+        duplicate means the row was created before a crash, so it counts as
+        imported.
+        """
+        handled = [(line, row) for line, row in batch if line in done]
+        self._mark_seen(handled, date_format, decimal, occurrences)
+        lines = []
+        records = []
+        keys = []
+        pending = [(line, row) for line, row in batch if line not in done]
+        for line, row, record_data, error in self._to_records(
+            pending, date_format, decimal
+        ):
+            if error is None:
+                records.append(record_data)
+                lines.append((line, row))
+                keys.append(f"{key_prefix}:{line}")
+                continue
+            progress["rejected"] += 1
+            done.add(line)
+            if on_rejected:
+                on_rejected(line, row, error)
+        if not records:
+            return
+        items = self.client.create_records(
+            records,
+            batch_size=len(records),
+            max_workers=self.max_workers,
+            idempotency_keys=keys,
+            occurrences=occurrences,
+        )
+        failure = None
+        for item in items:
+            line, row = lines[item["index"]]
+            error = item["error"]
+            if error is None or (resumed and isinstance(error, DuplicateRecordError)):
+                progress["imported"] += 1
+            elif is_retryable(error):
+                # Not done, sent again when the import resumes
+                failure = failure or error
+                continue
+            else:
+                progress["rejected"] += 1
+                if on_rejected:
+                    on_rejected(line, row, error)
+            done.add(line)
+        if failure is not None:
+            raise failure
+
+    def _mark_seen(self, batch, date_format, decimal, occurrences):
+        """Count rows handled by a previous run for the duplicate index"""
+        duplicates = self.client.duplicates
+        if duplicates is None or not batch:
+            return
+        for _, _, record_data, error in self._to_records(batch, date_format, decimal):
+            if error is None:
+                duplicates.mark_seen(record_data, occurrences)
+
+    def _to_records(self, batch, date_format, decimal):
+        """Yield (line, row, record_data, None) or (line, row, None, error)"""
+        suggestions = [None] * len(batch)
+        if self.suggester is not None:
+            suggestions = self.suggester.suggest_many(
+                row.get("description", "") for _, row in batch
+            )
+        for (line, row), suggestion in zip(batch, suggestions):
+            try:
+                record_data = self.to_record(row, date_format, decimal, suggestion)
+            except (ValueError, KeyError) as e:
+                yield line, row, None, e
+                continue
+            yield line, row, record_data, None
+
+    def _save(
+        self,
+        fingerprint: str,
+        key_prefix: str,
+        path: str,
+        progress: Dict[str, any],
+        done=(),
+    ):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO imports (fingerprint, path, line, imported, "
+                "rejected, finished, done, updated_at, size, key_prefix) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    fingerprint,
+                    os.path.abspath(path),
+                    progress["line"],
+                    progress["imported"],
+                    progress["rejected"],
+                    int(progress["finished"]),
+                    json_codec.dumps(sorted(done)).decode("utf-8"),
+                    time.time(),
+                    progress["total_bytes"],
+                    key_prefix,
+                ),
+            )
+
+    def _identify(self, path: str) -> Tuple[str, List[str]]:
+        """
+        Hash a file in one streamed pass, so a renamed copy still resumes
+        Returns:
+            ("<sha1 of the content>-<size>", fingerprints of the checkpoints
+            whose file is a prefix of this one, the longest last)
+        """
+        size = os.path.getsize(path)
+        with self._lock:
+            stored = self._conn.execute(
+                "SELECT fingerprint, size FROM imports "
+                "WHERE size IS NULL OR (size > 0 AND size < ?)",
+                (size,),
+            ).fetchall()
+        # Hashes to compare with at each offset
+        candidates = {}
+        legacy = set()
+        for fingerprint, stored_size in stored:
+            if stored_size is None:
+                legacy.add(fingerprint)
+            else:
+                candidates.setdefault(stored_size, set()).add(fingerprint)
+        offsets = sorted(candidates)
+        previous = []
+        digest = hashlib.sha1()
+        position = 0
+        with open(path, "rb") as f:
+            # Checkpoints of the 64 KiB fingerprint, whose file may have grown
+            head = hashlib.sha1(f.read(FINGERPRINT_BYTES)).hexdigest()
+            if head in legacy:
+                previous.append(head)
+            f.seek(0)
+            while True:
+                limit = HASH_CHUNK_BYTES
+                if offsets:
+                    # Stop at the next offset to compare the hash so far
+                    limit = min(limit, offsets[0] - position)
+                chunk = f.read(limit)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                position += len(chunk)
+                if offsets and offsets[0] == position:
+                    prefix = f"{digest.hexdigest()}-{position}"
+                    if prefix in candidates[offsets.pop(0)]:
+                        previous.append(prefix)
+        return f"{digest.hexdigest()}-{position}", previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path", help="CSV or OFX statement")
+    parser.add_argument("--base-url", default="http://192.168.0.243:8000")
+    parser.add_argument("--format", choices=("csv", "ofx"))
+    parser.add_argument("--encoding", default="utf-8-sig")
+    parser.add_argument("--batch-size", type=int, default=200)
+    parser.add_argument("--date-format")
+    parser.add_argument("--decimal", choices=(".", ","))
+    parser.add_argument("--category", type=int, default=1)
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint")
+    parser.add_argument(
+        "--duplicate-window",
+        type=int,
+        default=0,
+        help="Days around the date in which the same record also counts as a "
+        "duplicate, off by default so daily recurring charges are kept",
+    )
+    args = parser.parse_args()
+
+    def show_progress(progress):
+        percent = 100 * progress["bytes_read"] / (progress["total_bytes"] or 1)
+        print(
+            f"{percent:5.1f}% line {progress['line']}: "
+            f"{progress['imported']} imported, {progress['rejected']} rejected"
+        )
+
+    def show_rejected(line, row, error):
+        print(f"Line {line} rejected: {error}")
+
+    duplicates = DuplicateIndex(window_days=args.duplicate_window)
+    # Categories of rows without one are suggested from the local records
+    suggester = CategorySuggester()
+    ledger = RecordLedger()
+    suggester.learn_many(ledger.iter_records())
+    ledger.close()
+    with ExpensyClient(args.base_url, duplicates=duplicates) as client:
+        importer = StatementImporter(
+            client,
+            batch_size=args.batch_size,
+            default_category=args.category,
+            suggester=suggester,
+        )
+        if args.restart:
+            importer.forget(args.path)
+        try:
+            importer.import_file(
+                args.path,
+                file_format=args.format,
+                encoding=args.encoding,
+                date_format=args.date_format,
+                decimal=args.decimal,
+                on_progress=show_progress,
+                on_rejected=show_rejected,
+            )
+        finally:
+            importer.close()
+            duplicates.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+from category_cache import CategoryCache  # noqa: E402
+from duplicate_index import DuplicateIndex  # noqa: E402
+from expensy_client import ExpensyClient  # noqa: E402
+from stub_server import StubExpensyServer  # noqa: E402
+
+
+@pytest.fixture
+def server():
+    with StubExpensyServer(categories=3) as stub:
+        yield stub
+
+
+@pytest.fixture
+def duplicates():
+    index = DuplicateIndex(":memory:")
+    yield index
+    index.close()
+
+
+@pytest.fixture
+def client(server, duplicates, tmp_path):
+    """Client of the stub server that fails at once instead of retrying"""
+    with ExpensyClient(
+        server.base_url,
+        category_cache=CategoryCache(str(tmp_path / "categories.json")),
+        retries=0,
+        backoff_factor=0,
+        duplicates=duplicates,
+    ) as expensy_client:
+        yield expensy_client
@@ -0,0 +1,75 @@
+import pytest
+
+from duplicate_index import DuplicateIndex, DuplicateRecordError
+from ledger import RecordLedger
+
+COFFEE = {
+    "description": "Café  Central",
+    "amount": 3.5,
+    "source": "test",
+    "date": "2024-03-10",
+    "category": 1,
+}
+
+
+def test_find_counts_identical_records(duplicates):
+    duplicates.add_many([COFFEE, dict(COFFEE, description="cafe central!")])
+    assert duplicates.find(COFFEE) == "2024-03-10"
+    assert duplicates.find(COFFEE, occurrence=2) == "2024-03-10"
+    assert duplicates.find(COFFEE, occurrence=3) is None
+    assert duplicates.find(dict(COFFEE, amount=3.51)) is None
+
+
+def test_find_window_matches_neighbouring_days(duplicates):
+    duplicates.add(dict(COFFEE, date="2024-03-11"))
+    assert duplicates.find(COFFEE) is None
+    assert duplicates.find(COFFEE, window_days=1) == "2024-03-11"
+
+
+def test_check_with_seen_numbers_identical_records(duplicates):
+    duplicates.add(COFFEE)
+    seen = {}
+    # Only the first identical line of the import matches the stored record
+    with pytest.raises(DuplicateRecordError) as error:
+        duplicates.check(COFFEE, seen=seen)
+    assert error.value.matched_date == "2024-03-10"
+    duplicates.check(COFFEE, seen=seen)
+    duplicates.check(COFFEE, seen=seen)
+
+
+def test_mark_seen_keeps_the_numbering(duplicates):
+    duplicates.add_many([COFFEE, COFFEE])
+    seen = {}
+    duplicates.mark_seen(COFFEE, seen)
+    # The second line of the import, the first one was sent before
+    with pytest.raises(DuplicateRecordError):
+        duplicates.check(COFFEE, seen=seen)
+    duplicates.check(COFFEE, seen=seen)
+
+
+def test_records_with_a_known_id_are_counted_once(duplicates):
+    duplicates.add(COFFEE, record_id=7)
+    assert duplicates.add_many([dict(COFFEE, id=7), dict(COFFEE, id=8)]) == 1
+    assert duplicates.find(COFFEE, occurrence=2) is not None
+    assert duplicates.find(COFFEE, occurrence=3) is None
+
+
+def test_sync_does_not_count_created_records_again(client, duplicates):
+    client.create_record(COFFEE)
+    assert duplicates.find(COFFEE) is not None
+    ledger = RecordLedger(":memory:")
+    assert ledger.sync(client) == 1
+    assert duplicates.add_many(ledger.iter_records()) == 0
+    assert duplicates.find(COFFEE, occurrence=2) is None
+
+
+def test_counts_survive_a_restart(tmp_path):
+    path = str(tmp_path / "duplicates.sqlite3")
+    index = DuplicateIndex(path)
+    index.add(COFFEE, record_id=1)
+    index.close()
+    index = DuplicateIndex(path)
+    assert len(index) == 1
+    assert index.add_many([dict(COFFEE, id=1)]) == 0
+    assert index.find(COFFEE) == "2024-03-10"
+    index.close()
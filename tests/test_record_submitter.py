@@ -0,0 +1,45 @@
+import threading
+
+from duplicate_index import DuplicateRecordError
+from outbox import RecordOutbox
+from record_submitter import RecordSubmitter
+
+LUNCH = {
+    "description": "Almuerzo",
+    "amount": 12.0,
+    "source": "test",
+    "date": "2024-03-10",
+    "category": 2,
+}
+
+
+def replay(client, outbox, count):
+    """Drain an outbox left by a previous run, returns the callback results"""
+    results = []
+    finished = threading.Event()
+
+    def collect(record_data, outcome):
+        results.append(outcome)
+        if len(results) == count:
+            finished.set()
+
+    submitter = RecordSubmitter(
+        client, outbox=outbox, on_success=collect, on_error=collect
+    )
+    assert finished.wait(5)
+    assert submitter.pending == 0
+    submitter.shutdown()
+    return results
+
+
+def test_replay_keeps_allow_duplicate(client, duplicates, server):
+    duplicates.add(LUNCH)
+    outbox = RecordOutbox(":memory:")
+    outbox.enqueue(LUNCH, allow_duplicate=True)
+    outbox.enqueue(LUNCH)
+    created, rejected = replay(client, outbox, 2)
+    assert created["description"] == "Almuerzo"
+    assert isinstance(rejected, DuplicateRecordError)
+    assert len(server.records) == 1
+    # The confirmed duplicate is counted as well
+    assert duplicates.find(LUNCH, occurrence=2) is not None
@@ -0,0 +1,62 @@
+import pytest
+
+from ledger import RecordLedger
+from spending_analytics import NO_CATEGORY, SpendingAnalytics
+
+pytest.importorskip("numpy")
+
+
+def record(record_id, amount, day, category=1):
+    return {
+        "id": record_id,
+        "description": f"Registro {record_id}",
+        "amount": amount,
+        "date": day,
+        "category": category,
+        "modified": f"2024-06-01T00:00:{record_id:02d}",
+    }
+
+
+def test_refresh_reads_new_and_modified_records():
+    ledger = RecordLedger(":memory:")
+    ledger.upsert(
+        [
+            record(1, 10, "2024-01-01"),
+            record(2, 5.555, "sin fecha", None),
+            record(3, 1, "2024-01-02", None),
+        ],
+        "2024-06-01T00:00:03",
+    )
+    analytics = SpendingAnalytics.from_ledger(ledger)
+    assert len(analytics) == 2
+    assert analytics.category_totals() == {1: 10.0, NO_CATEGORY: 1.0}
+    assert analytics.refresh(ledger) == 0
+
+    changed = [
+        dict(record(1, 20, "2024-01-01"), modified="2024-06-01T00:00:04"),
+        dict(record(2, 5.555, "2024-02-01", 2), modified="2024-06-01T00:00:05"),
+        record(6, 2, "2024-01-03"),
+    ]
+    ledger.upsert(changed, "2024-06-01T00:00:06")
+    assert analytics.refresh(ledger) == 3
+    assert sorted(analytics.ids.tolist()) == [1, 2, 3, 6]
+    assert analytics.monthly_totals() == {"2024-01": 23.0, "2024-02": 5.56}
+    reloaded = SpendingAnalytics.from_ledger(ledger)
+    assert analytics.summary("2024-02-01") == reloaded.summary("2024-02-01")
+    ledger.close()
+
+
+def test_from_ledger_matches_from_rows():
+    ledger = RecordLedger(":memory:")
+    ledger.upsert(
+        record(i, 1.25 * i, f"2023-{i % 12 + 1:02d}-{i % 28 + 1:02d}", i % 3)
+        for i in range(1, 60)
+    )
+    rows = [
+        (f"2023-{i % 12 + 1:02d}-{i % 28 + 1:02d}", 1.25 * i, i % 3)
+        for i in range(1, 60)
+    ]
+    assert SpendingAnalytics.from_ledger(ledger).summary(
+        "2023-12-31"
+    ) == SpendingAnalytics.from_rows(rows).summary("2023-12-31")
+    ledger.close()
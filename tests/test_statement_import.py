@@ -0,0 +1,114 @@
+import io
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import requests  # noqa: E402
+
+from statement_import import (  # noqa: E402
+    StatementImporter,
+    iter_ofx_rows,
+    parse_amount,
+)
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ("1.234", 1234.0),
+        ("1,234", 1234.0),
+        ("1.234.567", 1234567.0),
+        ("1,234,567", 1234567.0),
+        ("-1.234,56", -1234.56),
+        ("1,234.56", 1234.56),
+        ("1.234.567,89", 1234567.89),
+        ("12,50", 12.5),
+        ("12,5", 12.5),
+        ("45.1", 45.1),
+        ("45.10", 45.1),
+        ("100", 100.0),
+        ("$ 1.500", 1500.0),
+    ],
+)
+def test_parse_amount_detects_separators(text, expected):
+    assert parse_amount(text) == pytest.approx(expected)
+
+
+@pytest.mark.parametrize(
+    "text, decimal, expected",
+    [
+        ("1.234", ",", 1234.0),
+        ("1.234", ".", 1.234),
+        ("0,125", ",", 0.125),
+        ("1,234.5", ".", 1234.5),
+    ],
+)
+def test_parse_amount_with_decimal_separator(text, decimal, expected):
+    assert parse_amount(text, decimal) == pytest.approx(expected)
+
+
+def test_parse_amount_rejects_text():
+    with pytest.raises(ValueError):
+        parse_amount("abc")
+
+
+def test_iter_ofx_rows_numbers_transactions_on_the_same_line():
+    transactions = "".join(
+        f"<STMTTRN><TRNAMT>-{i}.50<DTPOSTED>20240102120000<NAME>t{i}</STMTTRN>"
+        for i in range(1, 4)
+    )
+    stream = io.StringIO(f"<OFX><BANKTRANLIST>{transactions}</BANKTRANLIST></OFX>")
+    rows = list(iter_ofx_rows(stream))
+    assert [number for number, _ in rows] == [1, 2, 3]
+    assert rows[2][1] == {"description": "t3", "amount": "-3.50", "date": "20240102"}
+
+
+def write_statement(path, descriptions):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("fecha;concepto;importe\n")
+        for description in descriptions:
+            f.write(f"10/03/2024;{description};-1.234,50\n")
+
+
+def test_import_resumes_after_the_handled_rows(client, server, tmp_path):
+    path = str(tmp_path / "extracto.csv")
+    # Two identical rows, both must be imported
+    write_statement(path, [f"gasto {i}" for i in range(25)] + ["cafe", "cafe"])
+    importer = StatementImporter(
+        client, path=":memory:", batch_size=10, max_workers=1, categories=[]
+    )
+    server.error_rate = 0.3
+    with pytest.raises(requests.HTTPError):
+        importer.import_file(path)
+    fingerprint, _ = importer._identify(path)
+    checkpoint = importer.checkpoint(fingerprint)
+    assert not checkpoint["finished"]
+    sent = len(server.records)
+    assert checkpoint["imported"] == sent
+    # Lines after the header that were committed, and rows handled after them
+    committed = max(checkpoint["line"] - 1, 0)
+    assert len(checkpoint["done"]) == sent - committed
+
+    server.error_rate = 0
+    progress = importer.import_file(path)
+    assert progress["finished"]
+    assert progress["imported"] == 27
+    descriptions = sorted(record["description"] for record in server.records)
+    assert descriptions == sorted([f"gasto {i}" for i in range(25)] + ["cafe"] * 2)
+    # Already finished, nothing is sent again
+    assert importer.import_file(path)["imported"] == 27
+    assert len(server.records) == 27
+
+
+def test_import_of_a_grown_file_sends_only_the_new_rows(client, server, tmp_path):
+    path = str(tmp_path / "extracto.csv")
+    write_statement(path, [f"gasto {i}" for i in range(15)])
+    importer = StatementImporter(client, path=":memory:", batch_size=10, categories=[])
+    importer.import_file(path)
+    write_statement(path, [f"gasto {i}" for i in range(15)] + ["nuevo"])
+    progress = importer.import_file(path)
+    assert progress["imported"] == 16
+    assert [record["description"] for record in server.records][15:] == ["nuevo"]